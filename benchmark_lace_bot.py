@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import shutil
+import statistics
+import time
+from pathlib import Path
+
+from playwright.async_api import async_playwright
+
+from mock_mining_site import MockMiningSite
+from playwright_lace_bot import LACE_EXTENSION_ID, LAUNCH_PROFILES, PlaywrightLaceBot, StepTracer, clone_profile
+
+E2E_DATA_DIR = Path(__file__).parent / "wallets" / "_benchmark_e2e"
+
+
+def print_table(title, results, unit="s", fmt="{:.2f}"):
+    """In bảng p50 / mean / max cho từng biến thể"""
+    print("\n" + "="*60)
+    print(f"⏱️  {title}")
+    print("="*60)
+    print(f"{'Biến thể':<20} {'Lần':>5} {'p50':>10} {'mean':>10} {'max':>10}")
+    print("-"*60)
+    for name, samples in results.items():
+        if not samples:
+            print(f"{name:<20} {0:>5} {'-':>10} {'-':>10} {'-':>10}")
+            continue
+        cells = [(fmt.format(v) + unit) for v in (statistics.median(samples), statistics.mean(samples), max(samples))]
+        print(f"{name:<20} {len(samples):>5} " + " ".join(f"{c:>10}" for c in cells))
+
+
+async def time_lace_ready(bot, playwright, user_data, cloned, measure_rss=False):
+    """Thời gian từ lúc chuẩn bị profile tới khi nút Create wallet của Lace hiển thị
+
+    measure_rss=True: trả về (giây, RSS MB của cây process Chromium lúc Lace sẵn sàng)
+    """
+    if user_data.exists():
+        shutil.rmtree(user_data)
+    
+    started = time.perf_counter()
+    if cloned:
+        await asyncio.to_thread(clone_profile, bot.profile_template_dir, user_data)
+    else:
+        user_data.mkdir(parents=True, exist_ok=True)
+    
+    bot.resources.track("benchmark", user_data)
+    context = await bot.launch_context(playwright, user_data)
+    try:
+        page = await context.new_page()
+        await page.goto(f"chrome-extension://{LACE_EXTENSION_ID}/app.html", wait_until="domcontentloaded", timeout=90000)
+        await page.wait_for_selector('[data-testid="create-wallet-button"]', state='visible', timeout=90000)
+        elapsed = time.perf_counter() - started
+        if not measure_rss:
+            return elapsed
+        usage = await asyncio.to_thread(bot.resources.sample)
+        return elapsed, usage.get("benchmark", {}).get("rss", 0) / 2**20
+    finally:
+        await context.close()
+        shutil.rmtree(user_data, ignore_errors=True)
+
+
+async def bench_profile_template(rounds):
+    """Cold start (profile trống) so với clone từ golden profile"""
+    bot = PlaywrightLaceBot(use_profile_template=True)
+    user_data = bot.chrome_data_dir / "_benchmark"
+    results = {"cold": [], "cloned": []}
+    
+    async with async_playwright() as playwright:
+        started = time.perf_counter()
+        await bot.prepare_profile_template(playwright)
+        print(f"✅ Golden profile prepared in {time.perf_counter() - started:.2f}s")
+        
+        # Xen kẽ cold/cloned để page cache của OS không nghiêng về một phía
+        for i in range(rounds):
+            for variant in ("cold", "cloned"):
+                elapsed = await time_lace_ready(bot, playwright, user_data, cloned=(variant == "cloned"))
+                results[variant].append(elapsed)
+                print(f"  Round {i + 1}: {variant:<7} {elapsed:.2f}s")
+    
+    print_table("Lace ready: cold start vs cloned golden profile", results)
+
+
+async def bench_launch_profiles(rounds, profiles):
+    """Thời gian khởi động + RSS tới khi Lace sẵn sàng cho từng launch profile"""
+    bot = PlaywrightLaceBot()
+    if not bot.resources.available:
+        print("⚠️ Không có /proc - chỉ đo thời gian khởi động, không đo RAM")
+    user_data = bot.chrome_data_dir / "_benchmark"
+    startup = {name: [] for name in profiles}
+    memory = {name: [] for name in profiles}
+    
+    async with async_playwright() as playwright:
+        for i in range(rounds):
+            for name in profiles:
+                bot.launch_profile = name
+                elapsed, rss = await time_lace_ready(bot, playwright, user_data, cloned=False, measure_rss=True)
+                startup[name].append(elapsed)
+                if rss:
+                    memory[name].append(rss)
+                print(f"  Round {i + 1}: {name:<9} {elapsed:.2f}s  {rss:.0f} MB")
+    
+    print_table("Startup tới khi Lace sẵn sàng theo launch profile", startup)
+    if bot.resources.available:
+        print_table("RSS Chromium khi Lace sẵn sàng theo launch profile", memory, unit=" MB", fmt="{:.0f}")
+
+
+async def bench_e2e(levels, wallets, password, launch_profile, latency_ms, jitter_ms, rate_429, retry_after,
+                    prefetch_site=True):
+    """Toàn bộ pipeline với Lace thật trên server giả lập, so sánh các mức concurrency"""
+    site = MockMiningSite(latency_ms=latency_ms, jitter_ms=jitter_ms, rate_429=rate_429, retry_after=retry_after).start()
+    print(f"🧪 Mock mining site: {site.url} (latency {latency_ms}±{jitter_ms}ms, 429 rate {rate_429:.0%})")
+    rows = []
+    
+    try:
+        async with async_playwright() as playwright:
+            for level in levels:
+                # Mỗi mức concurrency một thư mục dữ liệu riêng - không đụng ví thật trong wallets/
+                bot = PlaywrightLaceBot(
+                    num_wallets=wallets, password=password, concurrency=level, start_spacing=0,
+                    launch_profile=launch_profile, use_profile_template=True,
+                    mining_site_url=site.url, data_dir=E2E_DATA_DIR / f"c{level}", prefetch_site=prefetch_site,
+                )
+                if bot.wallets_dir.exists():
+                    shutil.rmtree(bot.wallets_dir)
+                bot.start_logging()
+                bot.playwright_instance = playwright
+                await bot.prepare_profile_template(playwright)
+                
+                before = site.snapshot()
+                started = time.perf_counter()
+                await bot.run_batch(playwright, range(1, wallets + 1))
+                elapsed = time.perf_counter() - started
+                after = site.snapshot()
+                
+                await bot.stop_all_wallets()
+                bot.tracer.close()
+                if bot.state_store:
+                    bot.state_store.close()
+                bot.stop_logging()
+                
+                ok = bot.wallet_states.count("running")
+                failed = wallets - ok
+                bot.tracer.report(f"Step timing - concurrency {level}")
+                rows.append((level, wallets, ok, failed, elapsed, ok / (elapsed / 60),
+                             after["rate_limited"] - before["rate_limited"], bot.rate_controller.rate_limited_count))
+    finally:
+        site.stop()
+    
+    print("\n" + "="*70)
+    print("⏱️  End-to-end trên mock site theo concurrency")
+    print("="*70)
+    print(f"{'Conc.':>6} {'Ví':>5} {'OK':>5} {'Lỗi%':>7} {'Thời gian':>10} {'Ví/phút':>9} {'429 site':>9} {'429 bot':>8}")
+    print("-"*70)
+    for level, total, ok, failed, elapsed, per_minute, served_429, seen_429 in rows:
+        print(f"{level:>6} {total:>5} {ok:>5} {failed / total:>7.0%} {elapsed:>9.1f}s {per_minute:>9.2f} {served_429:>9} {seen_429:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Lace bot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    
+    template = sub.add_parser("profile-template", help="Cold start vs clone từ golden profile")
+    template.add_argument("--rounds", type=int, default=3)
+    
+    launch = sub.add_parser("launch-profiles", help="Startup time + RAM theo launch profile")
+    launch.add_argument("--rounds", type=int, default=3)
+    launch.add_argument("--profiles", nargs="+", choices=list(LAUNCH_PROFILES), default=list(LAUNCH_PROFILES))
+    
+    trace = sub.add_parser("trace-report", help="Bảng p50/p95/max từng bước từ file trace JSONL")
+    trace.add_argument("trace_file")
+    trace.add_argument("--run", help="Chỉ lấy span của run id này")
+    
+    e2e = sub.add_parser("e2e", help="Toàn bộ flow với Lace thật trên mock site, nhiều mức concurrency")
+    e2e.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4])
+    e2e.add_argument("--wallets", type=int, default=4, help="Số ví mỗi mức concurrency")
+    e2e.add_argument("--password", default="Benchmark#Pass2024")
+    e2e.add_argument("--launch-profile", choices=list(LAUNCH_PROFILES), default="headed")
+    e2e.add_argument("--latency-ms", type=float, default=150)
+    e2e.add_argument("--jitter-ms", type=float, default=100)
+    e2e.add_argument("--rate-429", type=float, default=0.0, help="Xác suất site trả 429 (0-1)")
+    e2e.add_argument("--retry-after", type=int, default=5)
+    e2e.add_argument("--no-prefetch", action="store_true", help="Tải site mining sau khi tạo ví xong (để so sánh)")
+    
+    args = parser.parse_args()
+    if args.command == "profile-template":
+        asyncio.run(bench_profile_template(args.rounds))
+    elif args.command == "launch-profiles":
+        asyncio.run(bench_launch_profiles(args.rounds, args.profiles))
+    elif args.command == "e2e":
+        asyncio.run(bench_e2e(args.levels, args.wallets, args.password, args.launch_profile,
+                              args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after,
+                              prefetch_site=not args.no_prefetch))
+    elif args.command == "trace-report":
+        StepTracer.report_file(args.trace_file, run_id=args.run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""Server giả lập sm.midnight.gd để benchmark bot offline
+
+Cùng các nút bot điều khiển (Get started, Lace, Continue, Next, #accept-terms,
+Accept and sign, Start session), kết nối ví qua CIP-30 (window.cardano.lace.enable)
+và ký qua api.signData - chạy được với Lace extension thật.
+
+    python mock_mining_site.py --port 8765 --latency-ms 200 --rate-429 0.05
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Trang không được chứa mã lỗi / "too many requests" - bot đọc nội dung trang để phát hiện 429
+SITE_HTML = """<!doctype html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Scavenger Mine (mock)</title>
+<style>
+  body { font-family: sans-serif; max-width: 520px; margin: 40px auto; }
+  .screen { display: none; }
+  .screen.active { display: block; }
+  button { display: block; margin: 8px 0; padding: 8px 16px; }
+  #error { color: #b00; }
+</style>
+</head>
+<body>
+<h1>Scavenger Mine</h1>
+<p id="error"></p>
+
+<div class="screen active" id="welcome">
+  <button id="get-started">Get started</button>
+</div>
+
+<div class="screen" id="wallets">
+  <p>Choose a wallet</p>
+  <button id="lace" disabled>Lace <small>INSTALLED</small></button>
+  <button id="continue" disabled>Continue</button>
+</div>
+
+<div class="screen" id="connected">
+  <p id="address"></p>
+  <button id="next">Next</button>
+</div>
+
+<div class="screen" id="terms">
+  <label><input type="checkbox" id="accept-terms"> I accept the terms</label>
+  <button id="accept-sign" disabled>Accept and sign</button>
+</div>
+
+<div class="screen" id="session">
+  <button id="start-session">Start session</button>
+  <p id="mining"></p>
+</div>
+
+<script>
+let api = null;
+let address = null;
+const $ = (id) => document.getElementById(id);
+
+function show(id) {
+  document.querySelectorAll(".screen").forEach((el) => el.classList.toggle("active", el.id === id));
+}
+
+function fail(message) {
+  $("error").textContent = message;
+}
+
+async function post(path, body) {
+  const response = await fetch(path, {
+    method: "POST",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify(body),
+  });
+  if (!response.ok) {
+    throw new Error(await response.text());
+  }
+  return response.json();
+}
+
+function toHex(text) {
+  return Array.from(new TextEncoder().encode(text), (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+$("get-started").onclick = () => {
+  show("wallets");
+  // Lace inject window.cardano.lace sau khi content script chạy
+  const poll = setInterval(() => {
+    if (window.cardano && window.cardano.lace) {
+      $("lace").disabled = false;
+      clearInterval(poll);
+    }
+  }, 100);
+};
+
+$("lace").onclick = () => {
+  $("continue").disabled = false;
+};
+
+$("continue").onclick = async () => {
+  $("continue").disabled = true;
+  try {
+    api = await window.cardano.lace.enable();
+    const used = await api.getUsedAddresses();
+    address = used.length ? used[0] : await api.getChangeAddress();
+    $("address").textContent = address;
+    show("connected");
+  } catch (e) {
+    fail("Wallet connection failed: " + (e.info || e.message || e));
+    $("continue").disabled = false;
+  }
+};
+
+$("next").onclick = () => show("terms");
+
+$("accept-terms").onchange = () => {
+  $("accept-sign").disabled = !$("accept-terms").checked;
+};
+
+$("accept-sign").onclick = async () => {
+  $("accept-sign").disabled = true;
+  fail("");
+  try {
+    const message = "I agree to the Scavenger Mine terms " + Date.now();
+    const signature = await api.signData(address, toHex(message));
+    await post("/api/register", {address, message, signature: signature.signature, key: signature.key});
+    show("session");
+  } catch (e) {
+    fail("We could not find the signed message. " + (e.info || e.message || e));
+    $("accept-sign").disabled = !$("accept-terms").checked;
+  }
+};
+
+$("start-session").onclick = async () => {
+  try {
+    await post("/api/session", {address});
+    $("start-session").style.display = "none";
+    // Bộ đếm solution tăng dần để SessionMonitor đo throughput
+    let solutions = 0;
+    $("mining").textContent = "Mining session active - Solutions found: 0";
+    setInterval(() => {
+      solutions += Math.floor(Math.random() * 3);
+      $("mining").textContent = "Mining session active - Solutions found: " + solutions;
+    }, 1000);
+  } catch (e) {
+    fail(e.message);
+  }
+};
+</script>
+</body>
+</html>
+"""
+
+
+class MockMiningSite:
+    """HTTP server giả lập site mining, chạy trong thread nền
+
+    latency_ms/jitter_ms: độ trễ mỗi request; rate_429: xác suất trả 429 (kèm Retry-After)
+    cho trang chính và các API đăng ký/start session.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0, jitter_ms=0, rate_429=0.0, retry_after=5, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"pages": 0, "registrations": 0, "sessions": 0, "rate_limited": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _delay(self):
+        with self.lock:
+            jitter = self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0
+            limited = self.rate_429 > 0 and self.random.random() < self.rate_429
+        delay = (self.latency_ms + jitter) / 1000
+        if delay:
+            time.sleep(delay)
+        return limited
+
+    def _handler_class(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status, body, content_type="text/plain; charset=utf-8", headers=()):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Cache-Control", "no-store")
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _rate_limited(self):
+                site._count("rate_limited")
+                self._send(429, "Too many requests", headers=[("Retry-After", str(site.retry_after))])
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/stats":
+                    self._send(200, json.dumps(site.snapshot()), "application/json")
+                    return
+                if path != "/":
+                    self._send(404, "Not found")
+                    return
+                if site._delay():
+                    self._rate_limited()
+                    return
+                site._count("pages")
+                self._send(200, SITE_HTML, "text/html; charset=utf-8")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._send(400, "Invalid JSON")
+                    return
+
+                if self.path == "/api/register":
+                    if not payload.get("signature"):
+                        self._send(400, "Missing signature")
+                        return
+                    key = "registrations"
+                elif self.path == "/api/session":
+                    key = "sessions"
+                else:
+                    self._send(404, "Not found")
+                    return
+
+                if site._delay():
+                    self._rate_limited()
+                    return
+                site._count(key)
+                self._send(200, json.dumps({"ok": True}), "application/json")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server giả lập sm.midnight.gd")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Xác suất trả 429 (0-1)")
+    parser.add_argument("--retry-after", type=int, default=5)
+    args = parser.parse_args()
+
+    site = MockMiningSite(args.host, args.port, args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after)
+    print(f"🧪 Mock mining site: {site.url}")
+    try:
+        site.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        site.server.server_close()
+        print(f"📊 {site.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,2057 @@
+import argparse
 import asyncio
+import base64
+import bisect
+import cProfile
+import csv
 import os
+import shutil
+import time
+from collections import Counter, OrderedDict, deque
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from urllib.parse import urlsplit
 from playwright.async_api import async_playwright
 from mnemonic import Mnemonic
 import json
-from datetime import datetime
+import logging
+import logging.handlers
+import math
+import pstats
+import queue
+import sys
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+LACE_EXTENSION_ID = "gafhhkghbfjjkeiendhlofajokpaflmk"
+MINING_SITE_URL = "https://sm.midnight.gd"
+
+
+# Các bước của pipeline một ví, theo thứ tự - wallet_states lưu bước cuối đã xong
+WALLET_STEPS = ("profile_ready", "wallet_created", "dapp_authorized", "message_signed", "session_started")
+
+
+def atomic_write_text(path, text):
+    """Ghi file qua file tạm + fsync + rename - crash giữa chừng không để lại file dở"""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+log = logging.getLogger("lace_bot")
+
+
+def log_event(message, wallet=None, step=None, summary=False, exc_info=False, level=logging.INFO):
+    """Ghi một dòng log (không chặn event loop - chỉ đẩy vào queue)
+
+    wallet/step: gắn tag để ghi vào file log riêng của ví; summary=True: luôn hiện trên console.
+    level: logging.WARNING/ERROR cho cảnh báo/lỗi - console gọn chỉ ẩn log INFO của từng ví.
+    """
+    log.log(level, message, exc_info=exc_info, extra={"wallet": wallet, "step": step, "summary": summary})
+
+
+class WalletLogFormatter(logging.Formatter):
+    """Dòng file log: thời gian, level, [ví:bước], nội dung"""
+
+    def format(self, record):
+        wallet = getattr(record, "wallet", None)
+        record.tag = f"[W{wallet}:{getattr(record, 'step', None) or '-'}] " if wallet is not None else ""
+        return super().format(record)
+
+
+class WalletLogRouter(logging.Handler):
+    """Ghi mọi record vào bot.log và record có tag ví vào wallet_N.log (rotating, mở khi cần)
+
+    Chạy trong thread của QueueListener nên I/O file không chặn event loop.
+    Chỉ giữ mở tối đa max_open_files file ví (LRU) - fleet lớn không cạn file descriptor.
+    """
+
+    def __init__(self, log_dir, max_bytes=1_000_000, backup_count=3, max_open_files=64):
+        super().__init__()
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.max_open_files = max_open_files
+        self.formatter = WalletLogFormatter("%(asctime)s %(levelname)-7s %(tag)s%(message)s")
+        self.fleet = self._rotating("bot.log")
+        self.wallets = OrderedDict()
+
+    def _rotating(self, name):
+        handler = logging.handlers.RotatingFileHandler(
+            self.log_dir / name, maxBytes=self.max_bytes, backupCount=self.backup_count,
+            encoding="utf-8", delay=True)
+        handler.setFormatter(self.formatter)
+        return handler
+
+    def emit(self, record):
+        self.fleet.handle(record)
+        wallet = getattr(record, "wallet", None)
+        if wallet is None:
+            return
+        handler = self.wallets.get(wallet)
+        if handler is None:
+            handler = self.wallets[wallet] = self._rotating(f"wallet_{wallet}.log")
+        self.wallets.move_to_end(wallet)
+        handler.handle(record)
+        
+        # Đóng stream của file ít dùng nhất (handler tự mở lại ở lần ghi sau vì delay=True)
+        open_handlers = [h for h in self.wallets.values() if h.stream is not None]
+        for stale in open_handlers[:max(0, len(open_handlers) - self.max_open_files)]:
+            with stale.lock:
+                stale.stream.close()
+                stale.stream = None
+
+    def close(self):
+        for handler in [self.fleet, *self.wallets.values()]:
+            handler.close()
+        super().close()
+
+
+class CompactConsoleFilter(logging.Filter):
+    """Console gọn: dòng chung + cảnh báo/lỗi của ví + mốc chính (summary); chi tiết từng bước nằm trong file"""
+
+    def __init__(self, wallet_level=logging.WARNING):
+        super().__init__()
+        self.wallet_level = wallet_level
+
+    def filter(self, record):
+        if getattr(record, "wallet", None) is None or getattr(record, "summary", False):
+            return True
+        return record.levelno >= self.wallet_level
+
+
+class CompactConsoleFormatter(logging.Formatter):
+    """Chỉ dòng đầu của record ví (traceback đầy đủ có trong file log của ví)"""
+
+    def format(self, record):
+        message = super().format(record)
+        if getattr(record, "wallet", None) is not None:
+            return message.split("\n", 1)[0]
+        return message
+
+
+def setup_logging(log_dir, verbose=False):
+    """Queue-backed logging: coroutine chỉ put_nowait, QueueListener (thread riêng) ghi console + file
+
+    Trả về listener đã start - gọi listener.stop() khi thoát để flush hết log.
+    """
+    log_queue = queue.SimpleQueue()
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(CompactConsoleFormatter("%(message)s"))
+    console.addFilter(CompactConsoleFilter(logging.INFO if verbose else logging.WARNING))
+    
+    log.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    log.setLevel(logging.DEBUG)
+    log.propagate = False
+    listener = logging.handlers.QueueListener(log_queue, console, WalletLogRouter(log_dir), respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+async def ainput(prompt=""):
+    """input() không chặn event loop - Playwright/scheduler vẫn chạy trong lúc đợi phím
+
+    POSIX: đợi stdin qua loop.add_reader. Nơi khác (Windows): đọc trên daemon thread không bị join,
+    không dùng asyncio.to_thread vì asyncio.run đợi thread đang kẹt trong input() nên Ctrl-C không thoát được.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    print(prompt, end="", flush=True)
+    
+    def on_line(line):
+        if not future.done():
+            if line:
+                future.set_result(line.rstrip("\n"))
+            else:
+                future.set_exception(EOFError())
+    
+    try:
+        fd = sys.stdin.fileno()
+        loop.add_reader(fd, lambda: on_line(sys.stdin.readline()))
+    except (AttributeError, OSError, ValueError, NotImplementedError):
+        def read():
+            try:
+                line = sys.stdin.readline()
+            except Exception:
+                line = ""
+            try:
+                loop.call_soon_threadsafe(on_line, line)
+            except RuntimeError:
+                pass  # Loop đã đóng (Ctrl-C) trong lúc đợi phím
+        threading.Thread(target=read, daemon=True).start()
+        return await future
+    
+    try:
+        return await future
+    finally:
+        loop.remove_reader(fd)
+
+
+def is_lace_url(url):
+    """URL thuộc extension Lace (tab app hoặc popup)"""
+    return "lace-popup" in url or f"chrome-extension://{LACE_EXTENSION_ID}" in url
+
+
+# Request filter: loại tài nguyên không cần cho automation
+BLOCKED_RESOURCE_TYPES = ("image", "media", "font")
+# Analytics / tracker (kể cả telemetry của Lace) - trả 204 rỗng
+TRACKER_URL_PATTERNS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "sentry.io",
+    "hotjar.com",
+    "segment.io",
+    "mixpanel.com",
+    "posthog.com",
+    "e.lw.iog.io",
+)
+# Luôn cho qua (captcha/challenge cần ảnh và font để vượt qua)
+ALLOWED_URL_PATTERNS = ("challenges.cloudflare.com",)
+# GIF 1x1 trong suốt - stub cho ảnh để trang không chạy nhánh onerror
+STUB_GIF = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+
+
+# Đọc toàn bộ text của các element khi đã đủ `min` phần tử - một round-trip CDP
+READ_TEXTS_JS = """([sel, min]) => {
+    const els = document.querySelectorAll(sel);
+    return els.length >= min && Array.from(els, el => el.textContent.trim());
+}"""
+
+# Điền nhiều input trong một lần evaluate: dùng native value setter + event input/change
+# để state của React (Lace) cập nhật như khi gõ tay. Trả về value thực tế của từng ô.
+FILL_INPUTS_JS = """(fields) => {
+    const setter = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, "value").set;
+    return fields.map(([selectors, index, value]) => {
+        let el = null;
+        for (const sel of selectors) {
+            el = document.querySelectorAll(sel)[index];
+            if (el) break;
+        }
+        if (!el) return null;
+        el.focus();
+        setter.call(el, value);
+        el.dispatchEvent(new Event("input", { bubbles: true }));
+        el.dispatchEvent(new Event("change", { bubbles: true }));
+        el.blur();
+        return el.value;
+    });
+}"""
+
+
+class RequestFilter:
+    """Chặn/stub ảnh, video, font, analytics trên một context và đếm request/byte đã tiết kiệm
+
+    Byte chỉ đếm được khi biết kích thước: file trong thư mục extension (đọc từ đĩa).
+    Request remote bị chặn trước khi tải nên chỉ đếm số lượng.
+    """
+
+    def __init__(self, extension_path, block_types=BLOCKED_RESOURCE_TYPES, block_patterns=TRACKER_URL_PATTERNS,
+                 allow_patterns=ALLOWED_URL_PATTERNS):
+        self.extension_path = Path(extension_path)
+        self.block_types = set(block_types)
+        self.block_patterns = tuple(block_patterns)
+        self.allow_patterns = tuple(allow_patterns)
+        self.requests = 0
+        self.bytes = 0
+        self.by_kind = {}  # "image"/"media"/"font"/"tracker" -> số request
+
+    async def attach(self, context):
+        await context.route("**/*", self._handle)
+
+    def _known_size(self, url):
+        prefix = f"chrome-extension://{LACE_EXTENSION_ID}/"
+        if not url.startswith(prefix):
+            return 0
+        path = self.extension_path / url[len(prefix):].split("?")[0].split("#")[0]
+        try:
+            return path.stat().st_size
+        except OSError:
+            return 0
+
+    async def _handle(self, route):
+        request = route.request
+        url = request.url
+        if any(p in url for p in self.allow_patterns):
+            await route.continue_()
+            return
+        
+        if any(p in url for p in self.block_patterns):
+            kind = "tracker"
+        elif request.resource_type in self.block_types:
+            kind = request.resource_type
+        else:
+            await route.continue_()
+            return
+        
+        self.requests += 1
+        self.bytes += self._known_size(url)
+        self.by_kind[kind] = self.by_kind.get(kind, 0) + 1
+        
+        if kind == "image":
+            await route.fulfill(status=200, content_type="image/gif", body=STUB_GIF)
+        elif kind == "tracker":
+            await route.fulfill(status=204, body="")
+        else:
+            await route.abort("blockedbyclient")
+
+    def summary(self):
+        kinds = ", ".join(f"{k} {n}" for k, n in sorted(self.by_kind.items()))
+        return f"{self.requests} requests, ≥ {self.bytes / 2**20:.1f} MB" + (f" ({kinds})" if kinds else "")
+
+
+# Flag Chromium tiết kiệm tài nguyên cho profile "minimal" - đã kiểm tra không ảnh hưởng Lace/mining
+MINIMAL_CHROMIUM_ARGS = [
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-sync",
+    "--disable-default-apps",
+    "--disable-domain-reliability",
+    "--disable-client-side-phishing-detection",
+    "--disable-breakpad",
+    "--metrics-recording-only",
+    "--mute-audio",
+    "--disable-gpu",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,DialMediaRouteProvider,AutofillServerCommunication",
+    # Tab mining chạy nền - không để Chromium throttle timer/renderer
+    "--disable-background-timer-throttling",
+    "--disable-renderer-backgrounding",
+    "--disable-backgrounding-occluded-windows",
+]
+
+# headed: cửa sổ thật (cần màn hình/Xvfb); headless: --headless=new vẫn load extension;
+# minimal: headless + MINIMAL_CHROMIUM_ARGS + viewport nhỏ hơn
+LAUNCH_PROFILES = {
+    "headed": {"headless_new": False, "args": [], "viewport": {"width": 1280, "height": 800}},
+    "headless": {"headless_new": True, "args": [], "viewport": {"width": 1280, "height": 800}},
+    "minimal": {"headless_new": True, "args": MINIMAL_CHROMIUM_ARGS, "viewport": {"width": 1024, "height": 720}},
+}
+
+# File khóa của Chromium + metadata của template - không copy sang profile mới
+PROFILE_SKIP_NAMES = {"SingletonLock", "SingletonCookie", "SingletonSocket", "lockfile", "LOCK", "template_info.json"}
+# Cache chỉ ghi một lần (V8 code cache của bundle Lace) - an toàn để hardlink
+PROFILE_HARDLINK_DIRS = ("Code Cache",)
+# ioctl FICLONE của Linux (reflink trên btrfs/xfs)
+FICLONE = 0x40049409
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def _reflink(src, dst):
+    """Copy-on-write clone file, trả về False nếu filesystem không hỗ trợ"""
+    if fcntl is None:
+        return False
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+
+def clone_profile(src, dst):
+    """Clone profile Chromium mẫu: reflink nếu được, hardlink cho code cache, còn lại copy.
+
+    Không hardlink file LevelDB/SQLite vì Chromium ghi đè tại chỗ - sẽ làm hỏng profile mẫu.
+    Trả về dict đếm số file theo từng cách clone.
+    """
+    src, dst = Path(src), Path(dst)
+    counts = {"reflink": 0, "hardlink": 0, "copy": 0}
+    use_reflink = True
+
+    for root, dirs, files in os.walk(src):
+        rel = Path(root).relative_to(src)
+        (dst / rel).mkdir(parents=True, exist_ok=True)
+        hardlink_ok = any(part in PROFILE_HARDLINK_DIRS for part in rel.parts)
+        for name in files:
+            if name in PROFILE_SKIP_NAMES:
+                continue
+            s, d = Path(root) / name, dst / rel / name
+            if s.is_symlink():
+                continue
+            if use_reflink:
+                if _reflink(s, d):
+                    counts["reflink"] += 1
+                    continue
+                # Filesystem không hỗ trợ - không thử lại cho các file sau
+                use_reflink = False
+            if hardlink_ok and not name.startswith("index"):
+                try:
+                    os.link(s, d)
+                    counts["hardlink"] += 1
+                    continue
+                except OSError:
+                    pass
+            shutil.copy2(s, d)
+            counts["copy"] += 1
+    return counts
+
+
+class RateLimited(Exception):
+    """sm.midnight.gd trả về 429 - ví sẽ được xếp hàng lại sau retry_after giây"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    """Header Retry-After (số giây hoặc HTTP date) -> số giây, None nếu không có/không hợp lệ"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class LacePopupNotFound(Exception):
+    """Không có popup Lace nào xuất hiện trong thời gian chờ"""
+
+
+class LacePopupTracker:
+    """Phát hiện popup Lace qua event "page" của context thay vì quét mọi tab mỗi giây"""
+
+    def __init__(self, context):
+        self.context = context
+        # Các page extension đã mở sẵn + mọi page mới mở sau khi bắt đầu theo dõi
+        self.pages = [p for p in context.pages if is_lace_url(p.url)]
+        self._changed = asyncio.Event()
+        context.on("page", self._on_page)
+
+    def _on_page(self, page):
+        self.pages.append(page)
+        self._changed.set()
+
+    def close(self):
+        """Gỡ listener khỏi context"""
+        self.context.remove_listener("page", self._on_page)
+
+    async def _probe(self, page, selector, timeout):
+        # Popup mới có thể mở ở about:blank trước khi điều hướng tới URL của Lace
+        if not is_lace_url(page.url):
+            await page.wait_for_url(is_lace_url, wait_until="commit", timeout=timeout)
+        await page.wait_for_selector(selector, state="visible", timeout=timeout)
+        return page
+
+    async def wait_for_popup(self, selector, timeout=20000):
+        """Trả về popup Lace đầu tiên có selector hiển thị, raise LacePopupNotFound nếu hết thời gian"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout / 1000
+        probes = {}
+        watched = 0
+        try:
+            while True:
+                for page in self.pages[watched:]:
+                    if not page.is_closed():
+                        probes[asyncio.create_task(self._probe(page, selector, timeout))] = page
+                watched = len(self.pages)
+                self._changed.clear()
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                changed = asyncio.create_task(self._changed.wait())
+                done, _ = await asyncio.wait(
+                    [*probes, changed], timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                changed.cancel()
+                for task in done:
+                    if task is changed:
+                        continue
+                    probes.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                if not done:
+                    break
+        finally:
+            for task in probes:
+                task.cancel()
+            await asyncio.gather(*probes, return_exceptions=True)
+
+        raise LacePopupNotFound(f"Không thấy popup Lace có {selector} sau {timeout / 1000:.0f}s")
+
+
+class WalletScheduler:
+    """Worker pool dạng sliding window: ví mới bắt đầu ngay khi có slot trống
+
+    Không dùng N worker cố định - vòng dispatch đọc lại `concurrency` mỗi lần
+    nên có thể đổi số slot khi đang chạy.
+    """
+
+    def __init__(self, concurrency=5, start_spacing=2.0, admit=None, admit_poll=2.0, name="Scheduler"):
+        self.name = name
+        self.concurrency = concurrency
+        self.start_spacing = start_spacing  # Khoảng cách tối thiểu (giây) giữa 2 lần start
+        # async admit() -> bool: kiểm tra tài nguyên trước khi start item mới
+        self.admit = admit
+        self.admit_poll = admit_poll
+        self.pending = deque()
+        self.active = 0
+        self.completed = 0
+        self.deferred = 0  # Item đã hẹn giờ xếp hàng lại (submit_later)
+        self.not_before = 0.0  # Không start item mới trước mốc này (loop time)
+        self._tasks = set()
+        self._wake = None
+        self._last_start = None
+        # Tích phân slot bận / slot có sẵn theo thời gian để tính utilization
+        self._started_at = None
+        self._last_account = None
+        self._busy_time = 0.0
+        self._capacity_time = 0.0
+
+    def _now(self):
+        return asyncio.get_running_loop().time()
+
+    def _account(self):
+        """Cộng dồn slot-giây từ lần đo trước (gọi trước khi active/concurrency đổi)"""
+        if self._last_account is None:
+            return
+        now = self._now()
+        elapsed = now - self._last_account
+        self._busy_time += self.active * elapsed
+        self._capacity_time += self.concurrency * elapsed
+        self._last_account = now
+
+    def _notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def submit(self, item):
+        self.pending.append(item)
+        self._notify()
+
+    def submit_many(self, items):
+        self.pending.extend(items)
+        self._notify()
+
+    def submit_later(self, item, delay):
+        """Xếp item vào hàng đợi sau delay giây (run() vẫn chờ item này)"""
+        self.deferred += 1
+        asyncio.get_running_loop().call_later(delay, self._release_deferred, item)
+
+    def _release_deferred(self, item):
+        self.deferred -= 1
+        self.submit(item)
+
+    def hold_until(self, deadline):
+        """Tạm ngừng start item mới tới deadline (loop time), item đang chạy không bị ảnh hưởng"""
+        self.not_before = max(self.not_before, deadline)
+        self._notify()
+
+    def set_concurrency(self, concurrency):
+        self._account()
+        self.concurrency = max(1, concurrency)
+        self._notify()
+
+    def utilization(self):
+        """Tỷ lệ slot bận trên tổng slot-giây kể từ khi run() bắt đầu"""
+        self._account()
+        if self._capacity_time <= 0:
+            return 0.0
+        return self._busy_time / self._capacity_time
+
+    def summary(self):
+        elapsed = (self._now() - self._started_at) if self._started_at is not None else 0.0
+        rate = self.completed * 60 / elapsed if elapsed > 0 else 0.0
+        return (f"queue {len(self.pending)} (+{self.deferred} deferred) | active {self.active}/{self.concurrency} | "
+                f"done {self.completed} | utilization {self.utilization():.0%} | {rate:.1f} wallets/min")
+
+    async def _run_one(self, item, worker, on_done):
+        result = None
+        try:
+            result = await worker(item)
+        except Exception as e:
+            result = e
+        finally:
+            self._account()
+            self.active -= 1
+            self.completed += 1
+            self._notify()
+        if on_done:
+            on_done(item, result)
+        log_event(f"📊 {self.name}: {self.summary()}")
+
+    async def run(self, worker, on_done=None):
+        """Chạy worker(item) cho mọi item trong hàng đợi, on_done(item, result) khi mỗi item xong"""
+        self._wake = asyncio.Event()
+        # Mỗi lần run (chạy đầu, restart hàng loạt) thống kê lại từ đầu
+        self.completed = 0
+        self._busy_time = self._capacity_time = 0.0
+        self._started_at = self._last_account = self._now()
+        
+        while self.pending or self.active or self.deferred:
+            if self.pending and self.active < self.concurrency:
+                # Giãn cách giữa các lần start + tôn trọng hold_until
+                start_at = self.not_before
+                if self._last_start is not None:
+                    start_at = max(start_at, self._last_start + self.start_spacing)
+                wait = start_at - self._now()
+                if wait <= 0 and self.admit is not None and not await self.admit():
+                    wait = self.admit_poll
+                if wait > 0:
+                    # Thức dậy sớm nếu concurrency/hold thay đổi trong lúc chờ
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                
+                item = self.pending.popleft()
+                self._account()
+                self.active += 1
+                self._last_start = self._now()
+                task = asyncio.create_task(self._run_one(item, worker, on_done))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                continue
+            
+            self._wake.clear()
+            await self._wake.wait()
+        
+        self._account()
+
+
+def read_proc_table():
+    """Đọc /proc: pid -> (ppid, rss_bytes, cpu_ticks, argv). Rỗng nếu không phải Linux"""
+    table = {}
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat", "rb") as f:
+                stat = f.read().decode(errors="replace")
+            with open(f"/proc/{entry.name}/cmdline", "rb") as f:
+                argv = f.read().decode(errors="replace").split("\0")
+        except OSError:
+            continue  # Process đã thoát giữa chừng
+        # comm có thể chứa dấu cách/ngoặc - tách sau dấu ")" cuối cùng
+        fields = stat[stat.rindex(")") + 2:].split()
+        table[int(entry.name)] = (
+            int(fields[1]),
+            int(fields[21]) * page_size,
+            int(fields[11]) + int(fields[12]),
+            argv,
+        )
+    return table
+
+
+class BrowserResourceMonitor:
+    """RSS/CPU thật của cây process Chromium từng ví (đọc /proc) + admission control
+
+    Ví mới chỉ được launch khi RSS dự kiến (gồm cả ví đang khởi động) nằm trong
+    memory_budget_mb và load trung bình mỗi core dưới max_load_per_core.
+    """
+
+    def __init__(self, memory_budget_mb=None, max_load_per_core=None, wallet_estimate_mb=700, warmup_seconds=60):
+        self.available = os.path.isdir("/proc/self/")
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.max_load_per_core = max_load_per_core
+        self.wallet_estimate = wallet_estimate_mb * 1024 * 1024
+        self.warmup_seconds = warmup_seconds
+        self.clk_tck = os.sysconf("SC_CLK_TCK") if self.available else 100
+        self.profiles = {}  # wallet_num -> user_data_dir của Chromium
+        self.launched_at = {}  # wallet_num -> thời điểm launch (monotonic)
+        self.usage = {}  # wallet_num -> {"rss": bytes, "cpu": %, "pids": [pid, ...]}
+        self._cpu_ticks = {}  # wallet_num -> (ticks, monotonic time) lần sample trước
+        self._waiting = False
+
+    def track(self, wallet_num, user_data):
+        """Gắn ví với profile Chromium để tìm cây process của nó"""
+        self.profiles[wallet_num] = str(user_data)
+        self.launched_at[wallet_num] = time.monotonic()
+        self._cpu_ticks.pop(wallet_num, None)
+
+    def sample(self):
+        """Đo lại RSS/CPU mọi ví, trả về self.usage"""
+        if not self.available:
+            return self.usage
+        table = read_proc_table()
+        children = {}
+        for pid, (ppid, _, _, _) in table.items():
+            children.setdefault(ppid, []).append(pid)
+        
+        now = time.monotonic()
+        usage = {}
+        for wallet_num, user_data in self.profiles.items():
+            pids = self._tree_pids(table, children, user_data)
+            rss = sum(table[pid][1] for pid in pids)
+            ticks = sum(table[pid][2] for pid in pids)
+            cpu = 0.0
+            prev = self._cpu_ticks.get(wallet_num)
+            if prev and now > prev[1]:
+                cpu = max(0.0, (ticks - prev[0]) / self.clk_tck / (now - prev[1]) * 100)
+            self._cpu_ticks[wallet_num] = (ticks, now)
+            usage[wallet_num] = {"rss": rss, "cpu": cpu, "pids": pids}
+        self.usage = usage
+        return usage
+
+    @staticmethod
+    def _tree_pids(table, children, user_data):
+        """Browser process (có đúng --user-data-dir, không có --type=) + mọi process con
+
+        So khớp nguyên một phần tử argv - so chuỗi con thì Wallet_1 sẽ dính cả Wallet_10..Wallet_19.
+        """
+        flag = f"--user-data-dir={user_data}"
+        roots = [pid for pid, (_, _, _, argv) in table.items()
+                 if flag in argv and not any(arg.startswith("--type=") for arg in argv)]
+        pids, stack = [], list(roots)
+        while stack:
+            pid = stack.pop()
+            pids.append(pid)
+            stack.extend(children.get(pid, ()))
+        return pids
+
+    def wallet_pids(self, wallet_num):
+        """PID cây process Chromium của một ví (đọc /proc ngay, không đụng self.usage)"""
+        user_data = self.profiles.get(wallet_num)
+        if not self.available or user_data is None:
+            return []
+        table = read_proc_table()
+        children = {}
+        for pid, (ppid, _, _, _) in table.items():
+            children.setdefault(ppid, []).append(pid)
+        return self._tree_pids(table, children, user_data)
+
+    def total_rss(self):
+        return sum(u["rss"] for u in self.usage.values())
+
+    def estimate_per_wallet(self):
+        """RSS trung bình của ví đã khởi động xong, hoặc wallet_estimate nếu chưa có"""
+        now = time.monotonic()
+        settled = [u["rss"] for w, u in self.usage.items()
+                   if u["rss"] and now - self.launched_at.get(w, now) >= self.warmup_seconds]
+        return sum(settled) / len(settled) if settled else self.wallet_estimate
+
+    def projected_rss(self):
+        """RSS hiện tại, tính ví còn đang khởi động theo mức ước lượng (chưa đạt RSS thật)"""
+        now = time.monotonic()
+        estimate = self.estimate_per_wallet()
+        total = 0
+        for wallet_num, u in self.usage.items():
+            warming = now - self.launched_at.get(wallet_num, now) < self.warmup_seconds
+            total += max(u["rss"], estimate) if warming else u["rss"]
+        return total
+
+    def load_per_core(self):
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+
+    async def admit(self):
+        """True nếu có thể launch thêm một ví trong ngân sách RAM/CPU"""
+        if not self.available or (self.memory_budget is None and self.max_load_per_core is None):
+            return True
+        await asyncio.to_thread(self.sample)
+        
+        reasons = []
+        if self.memory_budget is not None:
+            projected = self.projected_rss() + self.estimate_per_wallet()
+            if projected > self.memory_budget:
+                reasons.append(f"RAM {projected / 2**30:.1f}/{self.memory_budget / 2**30:.1f} GB")
+        if self.max_load_per_core is not None:
+            load = self.load_per_core()
+            if load > self.max_load_per_core:
+                reasons.append(f"load {load:.2f}/{self.max_load_per_core:.2f} per core")
+        
+        if reasons and not self._waiting:
+            log_event(f"🧠 Admission: holding new wallets - {', '.join(reasons)}", level=logging.WARNING)
+        elif not reasons and self._waiting:
+            log_event("🧠 Admission: resources available, resuming launches")
+        self._waiting = bool(reasons)
+        return not reasons
+
+
+class CpuAllocator:
+    """Ghim cây process Chromium của từng ví vào một nhóm core riêng + hạ độ ưu tiên (nice)
+
+    reserved_cores core đầu tiên dành cho bot (event loop, Playwright driver, launch ví mới);
+    mỗi ví nhận cores_per_wallet core đang ít ví dùng nhất trong các core còn lại.
+    Process/thread mới của ví (renderer tab mining, worker V8, ...) được ghim ở lần pin() kế tiếp. Chỉ chạy trên Linux.
+    """
+
+    def __init__(self, reserved_cores=1, cores_per_wallet=1, nice=10, interval=10.0):
+        self.available = hasattr(os, "sched_setaffinity") and hasattr(os, "setpriority")
+        cores = sorted(os.sched_getaffinity(0)) if self.available else []
+        # Máy quá ít core: không giữ core riêng cho bot
+        reserved_cores = min(reserved_cores, max(0, len(cores) - 1))
+        self.reserved = set(cores[:reserved_cores])
+        self.pool = cores[reserved_cores:]
+        self.cores_per_wallet = max(1, min(cores_per_wallet, len(self.pool) or 1))
+        self.nice = nice
+        self.interval = interval
+        self.assigned = {}  # {wallet_num: frozenset(core)}
+        self.pinned = {}    # {wallet_num: set(tid) đã ghim}
+        self.core_load = Counter({core: 0 for core in self.pool})  # Số ví trên mỗi core
+        self.errors = 0
+        self._task = None
+
+    def pin_orchestrator(self):
+        """Ghim mọi thread của bot vào core dành riêng - thread/process con tạo sau (Playwright driver) thừa hưởng
+
+        Chromium do driver launch cũng thừa hưởng, nên mỗi ví phải được pin_wallet() ngay sau khi launch.
+        """
+        if self.available and self.reserved:
+            # sched_setaffinity(0) chỉ áp dụng cho thread gọi - đặt cho từng thread đang có
+            for tid in os.listdir("/proc/self/task"):
+                try:
+                    os.sched_setaffinity(int(tid), self.reserved)
+                except ProcessLookupError:
+                    pass
+            log_event(f"🧩 CPU: bot trên core {sorted(self.reserved)}, ví trên {len(self.pool)} core còn lại")
+
+    def cores_for(self, wallet_num):
+        cores = self.assigned.get(wallet_num)
+        if cores is None:
+            # Core ít ví nhất, hòa thì core số nhỏ hơn
+            chosen = sorted(self.pool, key=lambda core: (self.core_load[core], core))[:self.cores_per_wallet]
+            cores = self.assigned[wallet_num] = frozenset(chosen)
+            for core in cores:
+                self.core_load[core] += 1
+        return cores
+
+    def release(self, wallet_num):
+        for core in self.assigned.pop(wallet_num, ()):
+            self.core_load[core] -= 1
+        self.pinned.pop(wallet_num, None)
+
+    def pin(self, usage):
+        """Ghim process chưa ghim của mọi ví theo usage (BrowserResourceMonitor.sample); ví không còn process -> trả core"""
+        if not self.available or not self.pool:
+            return
+        for wallet_num in [w for w in self.assigned if not usage.get(w, {}).get("pids")]:
+            self.release(wallet_num)
+        for wallet_num, entry in usage.items():
+            self.pin_wallet(wallet_num, entry.get("pids"))
+
+    def pin_wallet(self, wallet_num, pids):
+        """Ghim các thread chưa ghim của mọi pid một ví vào nhóm core của ví + đặt nice
+
+        sched_setaffinity/setpriority theo pid chỉ áp dụng cho một thread (TID == pid) - phải đặt
+        cho từng thread trong /proc/<pid>/task; gọi lại mỗi lần pin() để bắt thread tạo sau.
+        """
+        pids = set(pids or ())
+        if not self.available or not self.pool or not pids:
+            return
+        tids = set()
+        for pid in pids:
+            try:
+                tids.update(int(tid) for tid in os.listdir(f"/proc/{pid}/task"))
+            except OSError:
+                continue  # Process đã thoát
+        pinned = self.pinned.setdefault(wallet_num, set())
+        pinned &= tids  # Bỏ thread đã thoát
+        cores = self.cores_for(wallet_num)
+        for tid in tids - pinned:
+            try:
+                os.sched_setaffinity(tid, cores)
+                # Chỉ tăng nice (giảm ưu tiên) - không cần quyền root
+                if os.getpriority(os.PRIO_PROCESS, tid) < self.nice:
+                    os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+                pinned.add(tid)
+            except ProcessLookupError:
+                pass
+            except OSError as e:
+                self.errors += 1
+                if self.errors == 1:
+                    log_event(f"⚠️ CPU: Không ghim được thread {tid} của Wallet {wallet_num} - {e}", wallet=wallet_num, level=logging.WARNING)
+
+    def describe(self, wallet_num):
+        cores = self.assigned.get(wallet_num)
+        return f"core {','.join(map(str, sorted(cores)))}, nice {self.nice}" if cores else None
+
+    def wallets_per_core(self):
+        return len(self.assigned) * self.cores_per_wallet / len(self.pool) if self.pool else 0.0
+
+    async def _run(self, resources):
+        while True:
+            try:
+                self.pin(await asyncio.to_thread(resources.sample))
+            except Exception as e:
+                log_event(f"⚠️ CPU: {type(e).__name__} {e}", level=logging.WARNING)
+            await asyncio.sleep(self.interval)
+
+    def start(self, resources):
+        if self.available and self.pool and self._task is None:
+            self._task = asyncio.create_task(self._run(resources))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class AdaptiveRateController:
+    """AIMD cho WalletScheduler dựa trên 429 của sm.midnight.gd
+
+    429 -> giảm nửa concurrency, gấp đôi spacing và dừng start mới theo Retry-After.
+    Sau `success_window` ví thành công liên tiếp -> +1 concurrency, -spacing_step giây spacing.
+    """
+
+    def __init__(self, scheduler, min_concurrency=1, max_spacing=60.0, success_window=3,
+                 spacing_step=1.0, default_retry_after=180):
+        self.scheduler = scheduler
+        self.max_concurrency = scheduler.concurrency
+        self.base_spacing = scheduler.start_spacing
+        self.min_concurrency = min_concurrency
+        self.max_spacing = max_spacing
+        self.success_window = success_window
+        self.spacing_step = spacing_step
+        self.default_retry_after = default_retry_after
+        self.successes = 0
+        self.rate_limited_count = 0
+        self._backoff_until = 0.0
+
+    def on_rate_limited(self, retry_after=None):
+        """Ghi nhận một 429, trả về số giây cần đợi trước khi thử lại"""
+        delay = retry_after if retry_after is not None else self.default_retry_after
+        now = asyncio.get_running_loop().time()
+        self.rate_limited_count += 1
+        self.successes = 0
+        self.scheduler.hold_until(now + delay)
+        
+        # Nhiều ví dính 429 trong cùng một đợt chỉ tính là một lần giảm
+        if now < self._backoff_until:
+            return delay
+        self._backoff_until = now + delay
+        
+        concurrency = max(self.min_concurrency, self.scheduler.concurrency // 2)
+        spacing = min(self.max_spacing, max(self.base_spacing, self.scheduler.start_spacing) * 2)
+        self.scheduler.set_concurrency(concurrency)
+        self.scheduler.start_spacing = spacing
+        log_event(f"🐢 Rate limit: 429 (Retry-After {delay:.0f}s) -> concurrency {concurrency}, spacing {spacing:.1f}s", level=logging.WARNING)
+        return delay
+
+    def on_success(self):
+        """Ghi nhận một ví thành công, tăng dần lại sau chuỗi thành công đủ dài"""
+        self.successes += 1
+        if self.successes < self.success_window:
+            return
+        self.successes = 0
+        
+        concurrency = min(self.max_concurrency, self.scheduler.concurrency + 1)
+        spacing = max(self.base_spacing, self.scheduler.start_spacing - self.spacing_step)
+        if concurrency == self.scheduler.concurrency and spacing == self.scheduler.start_spacing:
+            return
+        self.scheduler.set_concurrency(concurrency)
+        self.scheduler.start_spacing = spacing
+        log_event(f"🚀 Rate limit: sustained success -> concurrency {concurrency}, spacing {spacing:.1f}s")
+
+
+WALLET_STATUSES = ("starting", "queued", "running", "stopped", "failed")
+ERROR_CLASSES = ("429", "timeout", "signature", "browser", "other")
+
+
+def classify_error(error):
+    """Nhóm lỗi để đếm/lọc trên dashboard: 429, timeout, signature, browser, other (None nếu không lỗi)"""
+    if not error:
+        return None
+    text = error.lower()
+    if "429" in text or "too many requests" in text:
+        return "429"
+    if "timeout" in text:
+        return "timeout"
+    if "sign" in text:
+        return "signature"
+    if "browser" in text or "crash" in text or "tab closed" in text:
+        return "browser"
+    return "other"
+
+
+class WalletRecord:
+    """Trạng thái một ví - đổi status/error tự cập nhật bộ đếm + chỉ mục của WalletRegistry"""
+
+    __slots__ = ("wallet_num", "_status", "_error", "error_class", "context", "start_time", "step", "_registry")
+
+    def __init__(self, wallet_num, status, context=None, start_time=None, error=None, step=None):
+        self.wallet_num = wallet_num
+        self._status = status
+        self._error = error
+        self.error_class = classify_error(error)
+        self.context = context
+        self.start_time = start_time or datetime.now()
+        self.step = step
+        self._registry = None
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        if value != self._status:
+            old = self._status
+            self._status = value
+            if self._registry is not None:
+                self._registry._moved("status", self.wallet_num, old, value)
+
+    @property
+    def error(self):
+        return self._error
+
+    @error.setter
+    def error(self, value):
+        self._error = value
+        error_class = classify_error(value)
+        if error_class != self.error_class:
+            old, self.error_class = self.error_class, error_class
+            if self._registry is not None:
+                self._registry._moved("error", self.wallet_num, old, error_class)
+
+
+class WalletRegistry:
+    """Tập ví dạng mapping {wallet_num: WalletRecord} với bộ đếm + chỉ mục cập nhật theo từng thay đổi
+
+    Đếm theo status / nhóm lỗi là O(1); mỗi status / nhóm lỗi có list wallet_num đã sort
+    nên lọc + phân trang dashboard chỉ tốn O(kích thước trang).
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.order = []  # Mọi wallet_num, đã sort
+        self.status_counts = Counter()
+        self.error_counts = Counter()
+        self.index = {"status": {}, "error": {}}  # {"status": {status: [wallet_num đã sort]}, "error": {...}}
+
+    def _add_index(self, kind, key, wallet_num):
+        if key is not None:
+            bisect.insort(self.index[kind].setdefault(key, []), wallet_num)
+            (self.status_counts if kind == "status" else self.error_counts)[key] += 1
+
+    def _remove_index(self, kind, key, wallet_num):
+        if key is not None:
+            nums = self.index[kind][key]
+            del nums[bisect.bisect_left(nums, wallet_num)]
+            counts = self.status_counts if kind == "status" else self.error_counts
+            counts[key] -= 1
+            if not counts[key]:
+                del counts[key]
+
+    def _moved(self, kind, wallet_num, old, new):
+        self._remove_index(kind, old, wallet_num)
+        self._add_index(kind, new, wallet_num)
+
+    def set(self, wallet_num, status, context=None, start_time=None, error=None, step=None):
+        """Thay record của ví (giữ nguyên vị trí trong các chỉ mục nếu ví đã có)"""
+        self.discard(wallet_num)
+        record = WalletRecord(wallet_num, status, context=context, start_time=start_time, error=error, step=step)
+        record._registry = self
+        self.records[wallet_num] = record
+        bisect.insort(self.order, wallet_num)
+        self._add_index("status", record.status, wallet_num)
+        self._add_index("error", record.error_class, wallet_num)
+        return record
+
+    def discard(self, wallet_num):
+        record = self.records.pop(wallet_num, None)
+        if record is None:
+            return
+        record._registry = None
+        del self.order[bisect.bisect_left(self.order, wallet_num)]
+        self._remove_index("status", record.status, wallet_num)
+        self._remove_index("error", record.error_class, wallet_num)
+
+    def count(self, status):
+        return self.status_counts[status]
+
+    def select(self, status=None, error_class=None):
+        """List wallet_num đã sort theo bộ lọc (tham chiếu chỉ mục - không copy)"""
+        if status and error_class:
+            # Hiếm dùng: lọc kết hợp trên chỉ mục nhỏ hơn
+            status_nums = self.index["status"].get(status, [])
+            error_nums = self.index["error"].get(error_class, [])
+            smaller, other = (status_nums, error_class) if len(status_nums) <= len(error_nums) else (error_nums, status)
+            if other == error_class:
+                return [n for n in smaller if self.records[n].error_class == error_class]
+            return [n for n in smaller if self.records[n].status == status]
+        if status:
+            return self.index["status"].get(status, [])
+        if error_class:
+            return self.index["error"].get(error_class, [])
+        return self.order
+
+    def page(self, status=None, error_class=None, page=0, page_size=25):
+        """(records của trang, tổng số ví khớp bộ lọc)"""
+        nums = self.select(status, error_class)
+        start = page * page_size
+        return [self.records[n] for n in nums[start:start + page_size]], len(nums)
+
+    # Giao diện mapping để code cũ dùng như dict
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, wallet_num):
+        return wallet_num in self.records
+
+    def __getitem__(self, wallet_num):
+        return self.records[wallet_num]
+
+    def __iter__(self):
+        return iter(list(self.order))
+
+    def get(self, wallet_num, default=None):
+        return self.records.get(wallet_num, default)
+
+    def keys(self):
+        return list(self.order)
+
+    def values(self):
+        return [self.records[n] for n in self.order]
+
+    def items(self):
+        return [(n, self.records[n]) for n in self.order]
+
+
+class WalletStateStore:
+    """Trạng thái ví trong SQLite (WAL) - mỗi thay đổi chỉ ghi một dòng
+
+    WAL + synchronous=NORMAL: commit là append vào file -wal, không viết lại cả file,
+    crash giữa chừng thì mất tối đa transaction cuối chứ không hỏng dữ liệu cũ.
+    """
+
+    COLUMNS = ("status", "start_time", "error", "step")
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS wallet_states ("
+            " wallet_num INTEGER PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " start_time TEXT,"
+            " error TEXT,"
+            " step TEXT,"
+            " updated_at TEXT NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_wallet_states_status ON wallet_states(status)")
+
+    @staticmethod
+    def _row(wallet_num, record):
+        return (
+            wallet_num,
+            record.status,
+            record.start_time.isoformat() if record.start_time else None,
+            record.error,
+            record.step,
+            datetime.now().isoformat(),
+        )
+
+    def put_many(self, items):
+        """Upsert nhiều ví trong một transaction - items: [(wallet_num, WalletRecord)]"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO wallet_states (wallet_num, status, start_time, error, step, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(wallet_num) DO UPDATE SET status=excluded.status, start_time=excluded.start_time,"
+                " error=excluded.error, step=excluded.step, updated_at=excluded.updated_at",
+                [self._row(wallet_num, state) for wallet_num, state in items])
+
+    def put(self, wallet_num, state):
+        self.put_many([(wallet_num, state)])
+
+    def query(self, status=None, error_like=None, step=None):
+        """Lọc ví ngay trong SQLite, vd query(status="failed", error_like="%429%")"""
+        clauses, params = [], []
+        for column, op, value in (("status", "=", status), ("error", "LIKE", error_like), ("step", "=", step)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        sql = "SELECT * FROM wallet_states"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        rows = self.conn.execute(sql + " ORDER BY wallet_num", params).fetchall()
+        return {
+            row["wallet_num"]: {
+                "status": row["status"],
+                "start_time": datetime.fromisoformat(row["start_time"]) if row["start_time"] else None,
+                "error": row["error"],
+                "step": row["step"],
+            }
+            for row in rows
+        }
+
+    def count_by_status(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM wallet_states GROUP BY status").fetchall())
+
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM wallet_states LIMIT 1").fetchone() is None
+
+    def import_json(self, json_file):
+        """Chuyển wallet_states.json (định dạng cũ) vào store, trả về số ví đã chuyển"""
+        with open(json_file, "r", encoding="utf-8") as f:
+            states = json.load(f)
+        items = []
+        for wallet_num_str, state_data in states.items():
+            start_time = state_data.get("start_time")
+            items.append((int(wallet_num_str), WalletRecord(
+                int(wallet_num_str), state_data["status"],
+                start_time=datetime.fromisoformat(start_time) if start_time else None,
+                error=state_data.get("error"),
+                step=state_data.get("step"),
+            )))
+        self.put_many(items)
+        return len(items)
+
+    def close(self):
+        # Checkpoint để file .db tự đầy đủ, không phụ thuộc -wal
+        try:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            self.conn.close()
+
+
+def percentile(samples, q):
+    """Percentile kiểu nearest-rank (q: 0-100) của list đã sort"""
+    return samples[max(0, math.ceil(q / 100 * len(samples)) - 1)]
+
+
+# Bucket (giây) cho histogram thời gian từng bước ở /metrics
+STEP_DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+
+class StepTracer:
+    """Đo thời gian từng bước của pipeline mỗi ví, ghi span ra file JSONL
+
+    Kiểu bấm giờ vòng: begin(wallet, step) tự đóng span đang mở của ví đó,
+    nên chỉ cần gọi begin ở đầu mỗi bước và end/fail khi ví xong hoặc lỗi.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.open_spans = {}  # {wallet_num: (step, perf_counter lúc bắt đầu, datetime bắt đầu)}
+        self.durations = {}   # {step: [giây]} - thứ tự step theo lần xuất hiện đầu tiên
+        self.failures = {}    # {step: số span lỗi}
+        # Histogram cộng dồn theo từng span (cho /metrics): {step: [đếm mỗi bucket + 1 ô +Inf]}, {step: tổng giây}
+        self.bucket_counts = {}
+        self.duration_sums = {}
+        self._file = None
+
+    def begin(self, wallet_num, step):
+        self.end(wallet_num)
+        self.open_spans[wallet_num] = (step, time.perf_counter(), datetime.now())
+
+    def end(self, wallet_num, ok=True, error=None):
+        """Đóng span đang mở của ví (không có thì bỏ qua)"""
+        span = self.open_spans.pop(wallet_num, None)
+        if span is None:
+            return
+        step, started, started_at = span
+        duration = time.perf_counter() - started
+        self.durations.setdefault(step, []).append(duration)
+        counts = self.bucket_counts.setdefault(step, [0] * (len(STEP_DURATION_BUCKETS) + 1))
+        counts[bisect.bisect_left(STEP_DURATION_BUCKETS, duration)] += 1
+        self.duration_sums[step] = self.duration_sums.get(step, 0.0) + duration
+        if not ok:
+            self.failures[step] = self.failures.get(step, 0) + 1
+        self._write({
+            "run": self.run_id,
+            "wallet": wallet_num,
+            "step": step,
+            "start": started_at.isoformat(),
+            "duration": round(duration, 4),
+            "ok": ok,
+            "error": str(error)[:200] if error else None,
+        })
+
+    def fail(self, wallet_num, error=None):
+        self.end(wallet_num, ok=False, error=error)
+
+    def _write(self, record):
+        if self.path is None:
+            return
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Line-buffered: mỗi span là một dòng append, không viết lại file
+            self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def report(self, title="Step timing"):
+        self.print_table(self.durations, self.failures, title)
+
+    @staticmethod
+    def print_table(durations, failures=None, title="Step timing"):
+        """In bảng p50 / p95 / max cho từng bước"""
+        if not durations:
+            return
+        failures = failures or {}
+        print("\n" + "="*60)
+        print(f"⏱️  {title}")
+        print("="*60)
+        print(f"{'Bước':<18} {'Lần':>5} {'Lỗi':>5} {'p50':>9} {'p95':>9} {'max':>9}")
+        print("-"*60)
+        for step, samples in durations.items():
+            samples = sorted(samples)
+            cells = [f"{v:.2f}s" for v in (percentile(samples, 50), percentile(samples, 95), samples[-1])]
+            print(f"{step:<18} {len(samples):>5} {failures.get(step, 0):>5} " + " ".join(f"{c:>9}" for c in cells))
+
+    @classmethod
+    def report_file(cls, path, run_id=None):
+        """In bảng từ file trace JSONL (lọc theo run nếu có)"""
+        durations, failures = {}, {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if run_id and record.get("run") != run_id:
+                    continue
+                durations.setdefault(record["step"], []).append(record["duration"])
+                if not record.get("ok", True):
+                    failures[record["step"]] = failures.get(record["step"], 0) + 1
+        cls.print_table(durations, failures, f"Step timing - {Path(path).name}")
+
+
+class TraceSampler:
+    """Playwright tracing cho mọi ví nhưng chỉ giữ file của ví lỗi hoặc chạy chậm (tail sampling)
+
+    Ví thành công và nhanh: tracing.stop() không path -> Playwright bỏ dữ liệu, không ghi đĩa.
+    Ngưỡng chậm: slow_after giây, hoặc p{slow_quantile} thời gian các ví thành công trước đó
+    (cần ít nhất min_samples ví, trước đó chỉ giữ trace của ví lỗi).
+    """
+
+    def __init__(self, trace_dir, slow_after=None, slow_quantile=95, min_samples=20, history=500, stop_timeout=30):
+        self.trace_dir = Path(trace_dir)
+        self.slow_after = slow_after
+        self.slow_quantile = slow_quantile
+        self.min_samples = min_samples
+        self.stop_timeout = stop_timeout
+        self.durations = deque(maxlen=history)  # Thời gian (giây) các ví thành công gần đây
+        self.active = {}  # {wallet_num: (context, perf_counter lúc bắt đầu)}
+        self.kept = 0
+        self.discarded = 0
+
+    def threshold(self):
+        if self.slow_after is not None:
+            return self.slow_after
+        if len(self.durations) < self.min_samples:
+            return None
+        return percentile(sorted(self.durations), self.slow_quantile)
+
+    async def start(self, wallet_num, context):
+        await self.discard(wallet_num)
+        try:
+            await context.tracing.start(screenshots=True, snapshots=True)
+        except Exception as e:
+            log_event(f"⚠️ Wallet {wallet_num}: Không bật được tracing - {type(e).__name__} {e}", wallet=wallet_num, level=logging.WARNING)
+            return
+        self.active[wallet_num] = (context, time.perf_counter())
+
+    async def discard(self, wallet_num):
+        """Bỏ trace đang ghi của ví (vd trước khi đóng context để launch lại)"""
+        span = self.active.pop(wallet_num, None)
+        if span:
+            await self._stop(wallet_num, span[0], None)
+
+    async def finish(self, wallet_num, failed, reason="failed"):
+        """Kết thúc trace của ví, trả về path file nếu được giữ lại"""
+        span = self.active.pop(wallet_num, None)
+        if span is None:
+            return None
+        context, started = span
+        duration = time.perf_counter() - started
+        threshold = self.threshold()
+        slow = threshold is not None and duration > threshold
+        if not failed:
+            self.durations.append(duration)
+        if not (failed or slow):
+            self.discarded += 1
+            await self._stop(wallet_num, context, None)
+            return None
+        
+        self.kept += 1
+        tag = reason if failed else "slow"
+        path = self.trace_dir / f"wallet_{wallet_num}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{tag}.zip"
+        self.trace_dir.mkdir(parents=True, exist_ok=True)
+        if await self._stop(wallet_num, context, path):
+            detail = f"{duration:.0f}s > p{self.slow_quantile} {threshold:.0f}s" if slow and not failed else reason
+            log_event(f"🎞️ Wallet {wallet_num}: Đã lưu Playwright trace ({detail}) -> {path}", wallet=wallet_num)
+            return path
+        return None
+
+    async def _stop(self, wallet_num, context, path):
+        try:
+            await asyncio.wait_for(context.tracing.stop(path=str(path) if path else None), timeout=self.stop_timeout)
+            return True
+        except Exception as e:
+            if path:
+                log_event(f"⚠️ Wallet {wallet_num}: Không lưu được trace - {type(e).__name__} {e}", wallet=wallet_num, level=logging.WARNING)
+            return False
+
+
+class OrchestratorProfiler:
+    """Profile phần Python của bot (không gồm Chromium) - kind: "cprofile" hoặc "yappi"
+
+    yappi (pip install yappi) đo cả thời gian wall của coroutine; cProfile có sẵn nhưng
+    chỉ thấy thời gian CPU giữa các lần await.
+    """
+
+    def __init__(self, kind, path, top=25):
+        self.kind = kind
+        self.path = Path(path)
+        self.top = top
+        self.profiler = None
+
+    def start(self):
+        if self.kind == "yappi":
+            try:
+                import yappi
+            except ImportError:
+                log_event("⚠️ Chưa cài yappi (pip install yappi) - dùng cProfile", level=logging.WARNING)
+                self.kind = "cprofile"
+            else:
+                yappi.set_clock_type("wall")
+                yappi.start()
+                self.profiler = yappi
+                return
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop(self):
+        """Dừng profiler, ghi file .prof (mở bằng snakeviz / pstats) và in các hàm tốn nhiều nhất"""
+        if self.profiler is None:
+            return None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.kind == "yappi":
+            self.profiler.stop()
+            self.profiler.get_func_stats().save(str(self.path), type="pstat")
+            self.profiler.clear_stats()
+        else:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path)
+        self.profiler = None
+        
+        print(f"\n🔬 Profile ({self.kind}): {self.path}")
+        pstats.Stats(str(self.path)).sort_stats("cumulative").print_stats(self.top)
+        return self.path
+
+
+# Đọc trạng thái phiên mining trên tab site: còn chạy không, bộ đếm solution, banner lỗi
+SESSION_PROBE_JS = r"""() => {
+    const visible = (el) => el && el.offsetParent !== null;
+    const buttons = Array.from(document.querySelectorAll("button"));
+    const startBtn = buttons.find((b) => /start session/i.test(b.textContent) && visible(b));
+    const text = document.body ? document.body.innerText : "";
+    const match = text.match(/solutions?[^0-9\n]{0,40}([\d][\d,.]*)/i);
+    const alert = Array.from(document.querySelectorAll('[role="alert"], .error, .toast-error')).find(
+        (el) => visible(el) && el.innerText.trim());
+    return {
+        active: !startBtn,
+        solutions: match ? parseFloat(match[1].replace(/,/g, "")) : null,
+        error: alert ? alert.innerText.trim().slice(0, 120) : null,
+    };
+}"""
+
+
+class SessionMonitor:
+    """Theo dõi phiên mining của các ví đang chạy (sau Start session)
+
+    Mỗi `interval` giây đọc tab mining của từng ví: phiên còn chạy, số solution, banner lỗi.
+    Page crash / browser đóng -> dead ngay (qua event). Solution không tăng trong `stall_after`
+    giây -> stalled. Lịch sử từng ví và toàn fleet giữ trong ring buffer `history` mẫu.
+    """
+
+    def __init__(self, interval=30.0, stall_after=300.0, history=720, probe_timeout=10.0, on_dead=None):
+        self.interval = interval
+        self.stall_after = stall_after
+        self.history = history
+        self.probe_timeout = probe_timeout
+        self.on_dead = on_dead
+        self.pages = {}      # {wallet_num: mining page}
+        self.health = {}     # {wallet_num: {"health", "active", "solutions", "rate", "error", "last_progress", "sampled_at"}}
+        self.series = {}     # {wallet_num: deque[(time, health, solutions, rate, error)]}
+        self.fleet = deque(maxlen=history)  # (time, ok, stalled, stopped, dead, solutions, rate)
+        self._listeners = {}  # {wallet_num: [(page | context, event, handler)]} - gỡ khi unwatch
+        self._task = None
+
+    def watch(self, wallet_num, page):
+        """Bắt đầu theo dõi tab mining của ví (thay page cũ nếu ví được restart)"""
+        self._detach(wallet_num)
+        self.pages[wallet_num] = page
+        self.health[wallet_num] = {
+            "health": "ok", "active": True, "solutions": None, "rate": None, "error": None,
+            "last_progress": time.monotonic(), "sampled_at": None,
+        }
+        self.series.setdefault(wallet_num, deque(maxlen=self.history))
+        listeners = [
+            (page, "crash", lambda _: self._mark_dead(wallet_num, page, "Page crashed")),
+            (page, "close", lambda _: self._mark_dead(wallet_num, page, "Mining tab closed")),
+            (page.context, "close", lambda _: self._mark_dead(wallet_num, page, "Browser disconnected")),
+        ]
+        for emitter, event, handler in listeners:
+            emitter.on(event, handler)
+        self._listeners[wallet_num] = listeners
+
+    def _detach(self, wallet_num):
+        """Gỡ handler crash/close của lần watch trước - soft restart không cộng dồn closure"""
+        for emitter, event, handler in self._listeners.pop(wallet_num, ()):
+            emitter.remove_listener(event, handler)
+
+    def unwatch(self, wallet_num):
+        """Ngừng theo dõi (gọi trước khi chủ động đóng ví để không báo dead nhầm)"""
+        self._detach(wallet_num)
+        self.pages.pop(wallet_num, None)
+        self.health.pop(wallet_num, None)
+
+    def _mark_dead(self, wallet_num, page, reason):
+        if self.pages.get(wallet_num) is not page:
+            return
+        self._detach(wallet_num)
+        self.pages.pop(wallet_num)
+        entry = self.health.get(wallet_num)
+        if entry is not None:
+            entry.update(health="dead", active=False, rate=None, error=reason)
+            self.series[wallet_num].append((datetime.now(), "dead", entry["solutions"], None, reason))
+        log_event(f"💀 Wallet {wallet_num}: {reason}", wallet=wallet_num, step="session", level=logging.ERROR)
+        if self.on_dead:
+            self.on_dead(wallet_num, reason)
+
+    async def _probe(self, page):
+        return await asyncio.wait_for(page.evaluate(SESSION_PROBE_JS), timeout=self.probe_timeout)
+
+    async def sample(self):
+        """Đọc tất cả tab mining song song, cập nhật health + ring buffer"""
+        items = list(self.pages.items())
+        results = await asyncio.gather(*(self._probe(page) for _, page in items), return_exceptions=True)
+        now = time.monotonic()
+        sampled_at = datetime.now()
+        
+        for (wallet_num, page), result in zip(items, results):
+            entry = self.health.get(wallet_num)
+            if entry is None or self.pages.get(wallet_num) is not page:
+                continue  # Ví bị unwatch / restart trong lúc đang đọc
+            
+            if isinstance(result, Exception):
+                # Tab treo (evaluate timeout) hoặc đang điều hướng - coi như không tiến triển
+                entry["error"] = f"Probe failed: {type(result).__name__} {result}"[:120]
+                entry["rate"] = None
+            else:
+                previous, previous_at = entry["solutions"], entry["sampled_at"]
+                solutions = result["solutions"]
+                if solutions is not None and previous is not None and previous_at is not None and now > previous_at:
+                    entry["rate"] = max(0.0, solutions - previous) * 60 / (now - previous_at)
+                if solutions is not None and solutions != previous:
+                    entry["last_progress"] = now
+                elif solutions is None and result["active"]:
+                    # Site không hiện bộ đếm - phiên còn chạy là đủ
+                    entry["last_progress"] = now
+                entry.update(active=result["active"], solutions=solutions, error=result["error"])
+                entry["sampled_at"] = now
+            
+            if not entry["active"]:
+                entry["health"] = "stopped"
+            elif now - entry["last_progress"] >= self.stall_after:
+                entry["health"] = "stalled"
+            else:
+                entry["health"] = "ok"
+            self.series[wallet_num].append(
+                (sampled_at, entry["health"], entry["solutions"], entry["rate"], entry["error"]))
+        
+        counts = self.summary()
+        self.fleet.append((
+            sampled_at, counts["ok"], counts["stalled"], counts["stopped"], counts["dead"],
+            sum(e["solutions"] or 0 for e in self.health.values()),
+            sum(e["rate"] or 0 for e in self.health.values()),
+        ))
+
+    def summary(self):
+        counts = {"ok": 0, "stalled": 0, "stopped": 0, "dead": 0}
+        for entry in self.health.values():
+            counts[entry["health"]] += 1
+        return counts
+
+    def last_summary(self):
+        """Số ví theo health ở mẫu fleet gần nhất - không duyệt lại từng ví"""
+        if not self.fleet:
+            return self.summary()
+        _, ok, stalled, stopped, dead = self.fleet[-1][:5]
+        return {"ok": ok, "stalled": stalled, "stopped": stopped, "dead": dead}
+
+    def scaling(self):
+        """Throughput theo số phiên ổn định: [(số ví ok, solution/phút trung bình, solution/phút mỗi ví, biên)]
+
+        Biên = solution/phút tăng thêm cho mỗi ví thêm so với mức số ví nhỏ hơn liền trước;
+        biên thấp hơn nhiều so với trung bình mỗi ví nghĩa là thêm ví chỉ tăng tranh chấp CPU.
+        """
+        by_count = {}
+        for _, ok, _, _, _, _, rate in self.fleet:
+            if ok and rate:
+                by_count.setdefault(ok, []).append(rate)
+        rows = []
+        previous = None
+        for count in sorted(by_count):
+            rate = sum(by_count[count]) / len(by_count[count])
+            marginal = (rate - previous[1]) / (count - previous[0]) if previous else None
+            rows.append((count, rate, rate / count, marginal))
+            previous = (count, rate)
+        return rows
+
+    def fleet_rate(self):
+        """Tổng solution/phút của mẫu fleet gần nhất"""
+        return self.fleet[-1][6] if self.fleet else 0.0
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.pages:
+                try:
+                    await self.sample()
+                except Exception as e:
+                    log_event(f"⚠️ Session monitor: {e}", exc_info=True, level=logging.WARNING)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def export_csv(self, path):
+        """Ghi lịch sử từng ví + fleet ra CSV (wallet = "fleet" cho dòng tổng)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["time", "wallet", "health", "solutions", "rate_per_min", "error",
+                             "ok", "stalled", "stopped", "dead"])
+            for wallet_num in sorted(self.series):
+                for sampled_at, health, solutions, rate, error in self.series[wallet_num]:
+                    writer.writerow([sampled_at.isoformat(), wallet_num, health, solutions,
+                                     f"{rate:.2f}" if rate is not None else "", error or "", "", "", "", ""])
+            for sampled_at, ok, stalled, stopped, dead, solutions, rate in self.fleet:
+                writer.writerow([sampled_at.isoformat(), "fleet", "", solutions, f"{rate:.2f}", "",
+                                 ok, stalled, stopped, dead])
+        return path
+
+
+class MetricsServer:
+    """HTTP server nhỏ trên event loop phục vụ GET /metrics (Prometheus text format)
+
+    collect: coroutine trả về text metrics. Mỗi kết nối là một task riêng nên
+    scrape không chặn các ví; đọc request có timeout để client treo không giữ socket.
+    """
+
+    def __init__(self, collect, host="127.0.0.1", port=9464, read_timeout=5):
+        self.collect = collect
+        self.host = host
+        self.port = port
+        self.read_timeout = read_timeout
+        self.server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/metrics"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        # port=0: lấy port thật hệ điều hành cấp
+        self.port = self.server.sockets[0].getsockname()[1]
+        log_event(f"📈 Metrics: {self.url}")
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=self.read_timeout)
+            method, path = (request.split(b"\r\n", 1)[0].decode("latin-1").split(" ") + ["", ""])[:2]
+            if method != "GET":
+                status, body, content_type = "405 Method Not Allowed", "Method not allowed\n", "text/plain"
+            elif path.split("?")[0] != "/metrics":
+                status, body, content_type = "404 Not Found", "Not found\n", "text/plain"
+            else:
+                status, body, content_type = "200 OK", await self.collect(), "text/plain; version=0.0.4"
+            data = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        except Exception as e:
+            log_event(f"⚠️ Metrics: {type(e).__name__} {e}", level=logging.WARNING)
+        finally:
+            writer.close()
+
 
 class PlaywrightLaceBot:
-    def __init__(self, num_wallets=1, password=""):
+    def __init__(self, num_wallets=1, password="", settle_delay_cap=0, popup_timeout=20000,
+                 use_profile_template=False, concurrency=5, start_spacing=2.0, max_rate_limit_retries=5,
+                 memory_budget_mb=None, max_load_per_core=None, launch_profile="headed",
+                 block_resources=False, request_allowlist=(), wallet_mode="create", step_trace=True,
+                 mining_site_url=MINING_SITE_URL, data_dir=None, health_interval=30, stall_after=300,
+                 wallet_timeout=600, close_concurrency=10, close_timeout=15, resume_ramp_start=2,
+                 verbose=False, dashboard_page_size=25, metrics_port=None, metrics_host="127.0.0.1",
+                 metrics_rss_interval=15, playwright_trace=False, trace_slow_after=None, profiler=None,
+                 cpu_affinity=False, reserved_cores=1, cores_per_wallet=1, wallet_nice=10, prefetch_site=True):
+        if launch_profile not in LAUNCH_PROFILES:
+            raise ValueError(f"launch_profile phải là một trong {', '.join(LAUNCH_PROFILES)}")
+        if wallet_mode not in ("create", "restore"):
+            raise ValueError("wallet_mode phải là 'create' hoặc 'restore'")
         self.num_wallets = num_wallets
         self.password = password
+        # Thời gian tối đa (ms) đợi popup Lace (Authorize / Confirm Data) xuất hiện
+        self.popup_timeout = popup_timeout
+        # Trần (giây) cho các delay cố định còn sót lại giữa các bước - 0 = bỏ hẳn,
+        # mỗi bước đã đợi tín hiệu sẵn sàng thật (element enabled, popup mở, ...)
+        self.settle_delay_cap = settle_delay_cap
         self.base_dir = Path(__file__).parent
-        self.wallets_dir = self.base_dir / "wallets"
-        self.extension_path = self.wallets_dir / "extensions" / "lace"
+        # data_dir: thư mục riêng cho mnemonic/profile/trạng thái (benchmark không đụng ví thật)
+        self.wallets_dir = Path(data_dir) if data_dir else self.base_dir / "wallets"
+        self.extension_path = self.base_dir / "wallets" / "extensions" / "lace"
+        # Site mining - đổi sang server giả lập (mock_mining_site.py) để benchmark offline
+        self.mining_site_url = mining_site_url
+        self.mining_site_host = urlsplit(mining_site_url).netloc
+        # Mở + tải site mining song song với lúc tạo ví Lace (kết nối ví vẫn đợi ví xong)
+        self.prefetch_site = prefetch_site
         self.chrome_data_dir = self.wallets_dir / "bot_chrome_data"
+        self.launch_profile = launch_profile
+        # create: Lace tự sinh 24 từ (ghi + xác nhận); restore: import mnemonic sinh sẵn
+        self.wallet_mode = wallet_mode
+        # Chặn ảnh/video/font/analytics trên mọi tab của ví (request_allowlist: pattern URL luôn cho qua)
+        self.block_resources = block_resources
+        self.request_allowlist = ALLOWED_URL_PATTERNS + tuple(request_allowlist)
+        self.request_filters = {}  # wallet_num -> RequestFilter
+        # Golden profile: extension đã cài + warm sẵn, profile ví mới được clone từ đây
+        self.use_profile_template = use_profile_template
+        self.profile_template_dir = self.chrome_data_dir / "_template"
         self.mnemo = Mnemonic("english")
         
         # Quản lý trạng thái ví
-        self.wallet_states = {}  # {wallet_num: {"status": "running/stopped/failed", "context": context, "start_time": datetime}}
+        self.wallet_states = WalletRegistry()  # {wallet_num: WalletRecord} + bộ đếm status/lỗi
+        # Dashboard: bộ lọc + trang đang xem
+        self.dashboard_status = None
+        self.dashboard_error = None
+        self.dashboard_page = 0
+        self.dashboard_page_size = dashboard_page_size
         self.playwright_instance = None
-        self.state_file = self.wallets_dir / "wallet_states.json"
+        # RAM/CPU thật của Chromium từng ví - chặn launch khi vượt ngân sách
+        self.resources = BrowserResourceMonitor(memory_budget_mb=memory_budget_mb, max_load_per_core=max_load_per_core)
+        self.scheduler = WalletScheduler(concurrency=concurrency, start_spacing=start_spacing, admit=self.resources.admit)
+        self.rate_controller = AdaptiveRateController(self.scheduler)
+        # Ghim Chromium từng ví vào core riêng + nice, giữ reserved_cores core cho bot (cpu_affinity=True, Linux)
+        self.cpu_allocator = CpuAllocator(reserved_cores=reserved_cores, cores_per_wallet=cores_per_wallet,
+                                          nice=wallet_nice) if cpu_affinity else None
+        # Số lần mỗi ví đã bị xếp hàng lại vì 429
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.rate_limit_retries = {}
+        # Giới hạn thời gian cho cả pipeline một ví (tạo/resume + kết nối site)
+        self.wallet_timeout = wallet_timeout
+        # Đóng ví hàng loạt (dừng/restart/thoát): số ví đóng cùng lúc + timeout mỗi ví
+        self.close_concurrency = close_concurrency
+        self.close_timeout = close_timeout
+        # Log từng ví ra wallets/logs/wallet_N.log; verbose=True: console hiện cả từng bước
+        self.log_dir = self.wallets_dir / "logs"
+        self.verbose = verbose
+        self.log_listener = None
+        # Resume fleet: bắt đầu với ít slot rồi tăng dần (AIMD +1 sau mỗi chuỗi thành công) tới concurrency
+        self.resume_ramp_start = resume_ramp_start
+        # SQLite WAL: lưu từng ví một dòng, không viết lại toàn bộ file mỗi lần đổi trạng thái
+        self.state_file = self.wallets_dir / "wallet_states.db"
+        self.legacy_state_file = self.wallets_dir / "wallet_states.json"
+        self.state_store = None
+        # Sức khỏe phiên mining của ví đang chạy (tab crash, browser đóng, solution đứng yên)
+        self.session_monitor = SessionMonitor(interval=health_interval, stall_after=stall_after,
+                                              on_dead=self.on_session_dead)
+        # Span thời gian từng bước của mỗi ví -> wallets/traces/run_<thời điểm>.jsonl (step_trace=False: chỉ in bảng)
+        self.tracer = StepTracer()
+        if step_trace:
+            self.tracer.path = self.wallets_dir / "traces" / f"run_{self.tracer.run_id}.jsonl"
+        # Endpoint Prometheus (metrics_port=None: tắt). RSS đo lại tối đa mỗi metrics_rss_interval giây
+        self.metrics_server = MetricsServer(self.collect_metrics, metrics_host, metrics_port) if metrics_port is not None else None
+        self.metrics_rss_interval = metrics_rss_interval
+        self._rss_sampled_at = None
+        # Playwright trace (screenshot + DOM + network) - chỉ giữ ví lỗi / chậm hơn p95 (hoặc trace_slow_after giây)
+        self.trace_sampler = TraceSampler(self.wallets_dir / "traces" / "playwright",
+                                          slow_after=trace_slow_after) if playwright_trace else None
+        # Profile orchestrator: None, "cprofile" hoặc "yappi" -> wallets/traces/profile_<run>.prof
+        self.profiler = OrchestratorProfiler(
+            profiler, self.wallets_dir / "traces" / f"profile_{self.tracer.run_id}.prof") if profiler else None
         
-    def save_wallet_states(self):
-        """Lưu trạng thái ví vào file"""
+    def open_state_store(self):
+        """Mở store trạng thái (lần đầu: chuyển dữ liệu từ wallet_states.json cũ)"""
+        if self.state_store is None:
+            self.wallets_dir.mkdir(parents=True, exist_ok=True)
+            self.state_store = WalletStateStore(self.state_file)
+            if self.state_store.is_empty() and self.legacy_state_file.exists():
+                migrated = self.state_store.import_json(self.legacy_state_file)
+                log_event(f"✅ Đã chuyển {migrated} ví từ {self.legacy_state_file.name} sang {self.state_file.name}")
+        return self.state_store
+    
+    def close_state_store(self):
+        if self.state_store is not None:
+            self.state_store.close()
+            self.state_store = None
+    
+    def save_wallet_states(self, *wallet_nums):
+        """Lưu trạng thái ví vào store - chỉ các ví truyền vào, không truyền thì lưu tất cả"""
         try:
-            states_to_save = {}
-            for wallet_num, state in self.wallet_states.items():
-                states_to_save[wallet_num] = {
-                    "status": state["status"],
-                    "start_time": state["start_time"].isoformat() if state["start_time"] else None,
-                    "error": state.get("error")
-                }
-            
-            with open(self.state_file, "w", encoding="utf-8") as f:
-                json.dump(states_to_save, f, indent=2, ensure_ascii=False)
+            if not wallet_nums:
+                wallet_nums = list(self.wallet_states)
+            self.open_state_store().put_many(
+                (wallet_num, self.wallet_states[wallet_num])
+                for wallet_num in wallet_nums if wallet_num in self.wallet_states)
         except Exception as e:
-            print(f"⚠️ Không thể lưu trạng thái: {e}")
+            log_event(f"⚠️ Không thể lưu trạng thái: {e}", level=logging.WARNING)
     
     def load_wallet_states(self):
-        """Tải trạng thái ví từ file"""
+        """Tải trạng thái ví từ store"""
         try:
-            if self.state_file.exists():
-                with open(self.state_file, "r", encoding="utf-8") as f:
-                    states = json.load(f)
-                
-                for wallet_num_str, state_data in states.items():
-                    wallet_num = int(wallet_num_str)
-                    self.wallet_states[wallet_num] = {
-                        "status": state_data["status"],
-                        "context": None,  # Context sẽ được tạo lại khi restart
-                        "start_time": datetime.fromisoformat(state_data["start_time"]) if state_data["start_time"] else datetime.now(),
-                        "error": state_data.get("error")
-                    }
-                print(f"✅ Đã tải trạng thái {len(self.wallet_states)} ví từ file")
+            for wallet_num, state in self.open_state_store().query().items():
+                # Context sẽ được tạo lại khi restart. Browser của lần chạy trước không còn - ví "running" /
+                # đang xử lý đánh dấu failed trong bộ nhớ (DB giữ nguyên để lần sau vẫn resume được)
+                status, error = state["status"], state["error"]
+                if status not in ("stopped", "failed"):
+                    status, error = "failed", "Browser không mở (từ lần chạy trước)"
+                self.wallet_states.set(wallet_num, status, start_time=state["start_time"],
+                                       error=error, step=state["step"])
+            if self.wallet_states:
+                log_event(f"✅ Đã tải trạng thái {len(self.wallet_states)} ví từ file")
         except Exception as e:
-            print(f"⚠️ Không thể tải trạng thái: {e}")
+            log_event(f"⚠️ Không thể tải trạng thái: {e}", level=logging.WARNING)
+    
+    def query_wallet_states(self, status=None, error_like=None, step=None):
+        """Truy vấn trạng thái đã lưu mà không nạp hết vào bộ nhớ, vd ví failed vì 429"""
+        return self.open_state_store().query(status=status, error_like=error_like, step=step)
+
+    def set_wallet_state(self, wallet_num, status, context=None, error=None):
+        """Ghi trạng thái mới cho ví, giữ nguyên bước checkpoint đã đạt"""
+        self.wallet_states.set(wallet_num, status, context=context, error=error, step=self.wallet_step(wallet_num))
+    
+    def log(self, wallet_num, message, summary=False, exc_info=False, level=logging.INFO):
+        """Log của một ví, gắn tag bước hiện tại (span đang mở hoặc checkpoint cuối)"""
+        span = self.tracer.open_spans.get(wallet_num)
+        step = span[0] if span else self.wallet_step(wallet_num)
+        log_event(message, wallet=wallet_num, step=step, summary=summary, exc_info=exc_info, level=level)
+    
+    def start_logging(self):
+        """Bật logging qua queue: console gọn + wallets/logs/bot.log + wallets/logs/wallet_N.log"""
+        if self.log_listener is None:
+            self.log_listener = setup_logging(self.log_dir, verbose=self.verbose)
+    
+    def stop_logging(self):
+        if self.log_listener is not None:
+            self.log_listener.stop()
+            self.log_listener = None
+    
+    async def pin_wallet_cpu(self, wallet_num):
+        """Ghim Chromium vừa launch vào core của ví ngay - không để nó chạy trên core của bot tới lần pin định kỳ"""
+        if self.cpu_allocator and self.cpu_allocator.pool:
+            pids = await asyncio.to_thread(self.resources.wallet_pids, wallet_num)
+            self.cpu_allocator.pin_wallet(wallet_num, pids)
+    
+    async def start_trace(self, wallet_num, context):
+        if self.trace_sampler:
+            await self.trace_sampler.start(wallet_num, context)
+    
+    async def finish_trace(self, wallet_num, failed, reason="failed"):
+        """Dừng trace của ví trước khi đóng context - giữ file nếu ví lỗi hoặc chậm"""
+        if self.trace_sampler:
+            await self.trace_sampler.finish(wallet_num, failed, reason)
+    
+    async def refresh_resources(self, max_age=0):
+        """Đo lại RSS/CPU (quét /proc trên thread riêng) nếu lần đo trước cũ hơn max_age giây"""
+        now = time.monotonic()
+        if self.resources.available and (self._rss_sampled_at is None or now - self._rss_sampled_at >= max_age):
+            self._rss_sampled_at = now
+            await asyncio.to_thread(self.resources.sample)
+    
+    async def collect_metrics(self):
+        """Metrics dạng Prometheus text - bộ đếm đọc sẵn, chỉ RSS cần quét /proc (trên thread riêng)"""
+        await self.refresh_resources(self.metrics_rss_interval)
+        
+        lines = []
+        
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        
+        registry = self.wallet_states
+        metric("lace_bot_wallets", "gauge", "Wallets per status",
+               [({"status": status}, registry.count(status)) for status in WALLET_STATUSES])
+        metric("lace_bot_wallet_errors", "gauge", "Wallets per error class",
+               [({"class": error_class}, registry.error_counts[error_class]) for error_class in ERROR_CLASSES])
+        metric("lace_bot_rate_limited_total", "counter", "HTTP 429 responses seen from the mining site",
+               [({}, self.rate_controller.rate_limited_count)])
         
+        scheduler = self.scheduler
+        metric("lace_bot_scheduler_queue_depth", "gauge", "Wallets waiting for a scheduler slot",
+               [({}, len(scheduler.pending))])
+        metric("lace_bot_scheduler_deferred", "gauge", "Wallets re-queued after a delay (429 retry)",
+               [({}, scheduler.deferred)])
+        metric("lace_bot_scheduler_active", "gauge", "Wallets currently in the pipeline", [({}, scheduler.active)])
+        metric("lace_bot_scheduler_concurrency", "gauge", "Current concurrency limit", [({}, scheduler.concurrency)])
+        
+        lines.append("# HELP lace_bot_step_duration_seconds Duration of each wallet pipeline step")
+        lines.append("# TYPE lace_bot_step_duration_seconds histogram")
+        for step, counts in self.tracer.bucket_counts.items():
+            cumulative = 0
+            for bound, count in zip(STEP_DURATION_BUCKETS + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'lace_bot_step_duration_seconds_bucket{{step="{step}",le="{bound}"}} {cumulative}')
+            lines.append(f'lace_bot_step_duration_seconds_sum{{step="{step}"}} {self.tracer.duration_sums[step]:.4f}')
+            lines.append(f'lace_bot_step_duration_seconds_count{{step="{step}"}} {cumulative}')
+        metric("lace_bot_step_failures_total", "counter", "Failed spans per step",
+               [({"step": step}, count) for step, count in self.tracer.failures.items()])
+        
+        metric("lace_bot_wallet_rss_bytes", "gauge", "Chromium RSS per wallet (browser + child processes)",
+               [({"wallet": wallet_num}, usage["rss"]) for wallet_num, usage in sorted(self.resources.usage.items())])
+        metric("lace_bot_wallet_cpu_percent", "gauge", "Chromium CPU per wallet (100 = one core)",
+               [({"wallet": wallet_num}, f"{usage['cpu']:.1f}") for wallet_num, usage in sorted(self.resources.usage.items())])
+        if self.session_monitor.fleet:
+            metric("lace_bot_mining_sessions", "gauge", "Mining sessions per health state",
+                   [({"health": health}, n) for health, n in self.session_monitor.last_summary().items()])
+            metric("lace_bot_mining_solutions_per_minute", "gauge", "Fleet solution rate",
+                   [({}, f"{self.session_monitor.fleet_rate():.2f}")])
+        return "\n".join(lines) + "\n"
+    
+    def on_session_dead(self, wallet_num, reason):
+        """SessionMonitor báo tab/browser của ví đã chết - đánh dấu failed để restart"""
+        state = self.wallet_states.get(wallet_num)
+        if state and state.status == "running":
+            # Tab crash / tab đóng: Chromium vẫn chạy - giữ context để dừng, soft restart hoặc đóng trước khi restart
+            context = None if reason == "Browser disconnected" else state.context
+            self.set_wallet_state(wallet_num, "failed", context=context, error=reason)
+            self.save_wallet_states(wallet_num)
+    
+    def wallet_error(self, wallet_num):
+        state = self.wallet_states.get(wallet_num)
+        return state.error if state else None
+    
+    def wallet_step(self, wallet_num):
+        """Bước cuối cùng ví đã hoàn thành (None nếu chưa có)"""
+        state = self.wallet_states.get(wallet_num)
+        return state.step if state else None
+    
+    def step_done(self, wallet_num, step):
+        """Ví đã hoàn thành `step` (hoặc một bước sau nó)"""
+        done = self.wallet_step(wallet_num)
+        return done is not None and WALLET_STEPS.index(done) >= WALLET_STEPS.index(step)
+    
+    def mark_step(self, wallet_num, step, reset=False):
+        """Checkpoint: ghi nhận ví đã xong `step` và lưu ngay (reset=True cho phép lùi về step)"""
+        if wallet_num not in self.wallet_states:
+            self.wallet_states.set(wallet_num, "starting")
+        if reset or not self.step_done(wallet_num, step):
+            self.wallet_states[wallet_num].step = step
+            self.save_wallet_states(wallet_num)
+    
+    async def settle(self, seconds):
+        """Delay cố định tùy chọn - bị giới hạn bởi settle_delay_cap (mặc định bỏ qua)"""
+        delay = min(seconds, self.settle_delay_cap)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def wait_enabled(self, page, selector, timeout=30000):
+        """Đợi element hiển thị và enabled, trả về locator để click"""
+        locator = page.locator(selector).first
+        await locator.wait_for(state="visible", timeout=timeout)
+        handle = await locator.element_handle(timeout=timeout)
+        await handle.wait_for_element_state("enabled", timeout=timeout)
+        return locator
+
+    async def read_texts(self, page, selector, min_count, timeout=60000):
+        """Đợi đủ min_count element rồi lấy text của tất cả trong một lần evaluate"""
+        handle = await page.wait_for_function(READ_TEXTS_JS, arg=[selector, min_count], timeout=timeout)
+        return await handle.json_value()
+
+    async def fill_inputs(self, page, fields):
+        """Điền nhiều input một lần; fields = [(selectors, index, value), ...]
+
+        Ô nào page không nhận đúng giá trị thì fill lại bằng Playwright. Trả về số ô đã điền đúng.
+        """
+        payload = [[list(selectors), index, value] for selectors, index, value in fields]
+        values = await page.evaluate(FILL_INPUTS_JS, payload)
+        filled = 0
+        for (selectors, index, value), actual in zip(fields, values):
+            if actual == value:
+                filled += 1
+                continue
+            if actual is None:
+                continue  # Không tìm thấy ô
+            for sel in selectors:
+                inputs = page.locator(sel)
+                if await inputs.count() > index:
+                    await inputs.nth(index).fill(value)
+                    filled += 1
+                    break
+        return filled
+
+    async def wait_popup_or_selector(self, popups, popup_selector, page, selector):
+        """Đợi popup Lace có popup_selector HOẶC selector hiện trên page
+
+        Trả về popup nếu popup tới trước, None nếu page đã sẵn sàng mà không cần popup.
+        """
+        popup_task = asyncio.create_task(popups.wait_for_popup(popup_selector, timeout=self.popup_timeout))
+        page_task = asyncio.create_task(page.wait_for_selector(selector, state="visible", timeout=self.popup_timeout))
+        try:
+            pending = {popup_task, page_task}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if popup_task in done and popup_task.exception() is None:
+                    return popup_task.result()
+                if page_task in done and page_task.exception() is None:
+                    return None
+            raise LacePopupNotFound(f"Không thấy popup Lace ({popup_selector}) hay {selector} trên trang")
+        finally:
+            for task in (popup_task, page_task):
+                task.cancel()
+            await asyncio.gather(popup_task, page_task, return_exceptions=True)
+    
+    async def wait_any(self, page, selectors, timeout=30000):
+        """Đợi selector đầu tiên hiển thị trong danh sách, trả về selector đó (None nếu hết thời gian)"""
+        tasks = {
+            asyncio.create_task(page.wait_for_selector(s, state="visible", timeout=timeout)): s
+            for s in selectors
+        }
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return tasks[task]
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
     async def create_wallet_mnemonic(self, wallet_num):
         """Tạo mnemonic 24 từ cho wallet"""
         mnemonic = self.mnemo.generate(strength=256)  # 24 từ
@@ -65,113 +2061,297 @@ class PlaywrightLaceBot:
         with open(wallet_dir / "mnemonic.txt", "w") as f:
             f.write(mnemonic)
         
-        print(f"✅ Wallet {wallet_num}: Created mnemonic")
+        self.log(wallet_num, f"✅ Wallet {wallet_num}: Created mnemonic")
         return mnemonic
     
-    async def launch_browser_with_wallet(self, wallet_num, playwright):
-        """Khởi động browser riêng cho mỗi wallet với Lace extension"""
-        mnemonic = await self.create_wallet_mnemonic(wallet_num)
+    def read_saved_mnemonic(self, wallet_num):
+        """Mnemonic đã lưu của ví nếu còn hợp lệ (checksum BIP39), ngược lại None"""
+        mnemonic_file = self.wallets_dir / f"wallet_{wallet_num}" / "mnemonic.txt"
+        try:
+            mnemonic = mnemonic_file.read_text(encoding="utf-8").strip()
+        except OSError:
+            return None
+        if len(mnemonic.split()) == 24 and self.mnemo.check(mnemonic):
+            return mnemonic
+        return None
+    
+    def wallet_password(self, wallet_num):
+        """Mật khẩu đã lưu trong wallet_info.json của ví (ví tạo ở lần chạy trước), mặc định self.password"""
+        info_file = self.wallets_dir / f"wallet_{wallet_num}" / "wallet_info.json"
+        try:
+            with open(info_file, "r", encoding="utf-8") as f:
+                return json.load(f).get("password") or self.password
+        except (OSError, ValueError):
+            return self.password
+    
+    def pregenerate_mnemonics(self, wallet_nums):
+        """Sinh + kiểm tra checksum mnemonic cho mọi ví và ghi xuống đĩa trước khi mở browser
+
+        Ví đã có mnemonic hợp lệ được giữ nguyên - ví có thể đã đăng ký với phrase đó.
+        """
+        created = kept = 0
+        for wallet_num in wallet_nums:
+            if self.read_saved_mnemonic(wallet_num):
+                kept += 1
+                continue
+            
+            mnemonic = self.mnemo.generate(strength=256)  # 24 từ
+            if not self.mnemo.check(mnemonic):
+                raise ValueError(f"Wallet {wallet_num}: generated mnemonic failed checksum")
+            
+            wallet_dir = self.wallets_dir / f"wallet_{wallet_num}"
+            wallet_dir.mkdir(parents=True, exist_ok=True)
+            wallet_info = {
+                "wallet_name": f"Wallet {wallet_num}",
+                "mnemonic": mnemonic,
+                "password": self.password
+            }
+            atomic_write_text(wallet_dir / "wallet_info.json", json.dumps(wallet_info, indent=2, ensure_ascii=False))
+            atomic_write_text(wallet_dir / "mnemonic.txt", mnemonic)
+            created += 1
+        
+        log_event(f"✅ Pre-generated {created} mnemonics ({kept} existing kept) - checksums verified")
+    
+    async def launch_context(self, playwright, user_data):
+        """Mở persistent context Chromium với Lace extension trên user_data theo launch_profile"""
+        profile = LAUNCH_PROFILES[self.launch_profile]
+        args = [
+            f"--disable-extensions-except={self.extension_path}",
+            f"--load-extension={self.extension_path}",
+        ]
+        # Headless cũ của Playwright không load extension - dùng chế độ headless=new của Chromium
+        if profile["headless_new"]:
+            args.append("--headless=new")
+        args.extend(profile["args"])
+        return await playwright.chromium.launch_persistent_context(
+            user_data_dir=str(user_data),
+            headless=False,
+            args=args,
+            viewport=profile["viewport"],
+            # Tự động cho phép clipboard permission
+            permissions=["clipboard-read", "clipboard-write"],
+        )
+    
+    def lace_version(self):
+        """Version Lace trong manifest - dùng để biết khi nào phải dựng lại profile mẫu"""
+        try:
+            with open(self.extension_path / "manifest.json", "r", encoding="utf-8") as f:
+                return json.load(f).get("version")
+        except Exception:
+            return None
+    
+    def profile_template_ready(self):
+        """Profile mẫu đã được dựng cho đúng version Lace hiện tại"""
+        info_file = self.profile_template_dir / "template_info.json"
+        if not info_file.exists():
+            return False
+        try:
+            with open(info_file, "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except Exception:
+            return False
+        return info.get("lace_version") == self.lace_version()
+    
+    async def prepare_profile_template(self, playwright, force=False):
+        """Cài và warm Lace một lần trong profile mẫu (service worker, code cache của bundle)"""
+        if not force and self.profile_template_ready():
+            log_event("✅ Profile template: Reusing existing golden profile")
+            return
+        
+        if self.profile_template_dir.exists():
+            shutil.rmtree(self.profile_template_dir)
+        self.profile_template_dir.mkdir(parents=True, exist_ok=True)
+        
+        context = await self.launch_context(playwright, self.profile_template_dir)
+        try:
+            # Đợi service worker của Lace đăng ký xong
+            if not context.service_workers:
+                await context.wait_for_event("serviceworker", timeout=60000)
+            
+            page = await context.new_page()
+            extension_url = f"chrome-extension://{LACE_EXTENSION_ID}/app.html"
+            # Load 2 lần: V8 chỉ ghi code cache cho bundle (773.js, 85.js, 348.js, .wasm) từ lần chạy thứ hai
+            for _ in range(2):
+                await page.goto(extension_url, wait_until="domcontentloaded", timeout=90000)
+                await page.wait_for_selector('[data-testid="create-wallet-button"]', state='visible', timeout=60000)
+        finally:
+            await context.close()
         
+        with open(self.profile_template_dir / "template_info.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "lace_version": self.lace_version(),
+                "created_at": datetime.now().isoformat(),
+            }, f, indent=2)
+        log_event("✅ Profile template: Golden profile ready")
+    
+    async def launch_browser_with_wallet(self, wallet_num, playwright, reuse_profile=False):
+        """Khởi động browser riêng cho mỗi wallet với Lace extension
+
+        reuse_profile=True: mở lại profile Chromium sẵn có (ví đã tạo), không xóa, không sinh mnemonic mới
+        (profile bị mất thì mở profile trống để restore lại từ mnemonic đã lưu).
+        """
         # User data riêng cho mỗi wallet
         user_data = self.chrome_data_dir / f"Wallet_{wallet_num}"
         
+        if reuse_profile:
+            user_data.mkdir(parents=True, exist_ok=True)
+            self.resources.track(wallet_num, user_data)
+            context = await self.launch_context(playwright, user_data)
+            await self.pin_wallet_cpu(wallet_num)
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Browser relaunched on existing profile")
+            if self.block_resources:
+                request_filter = RequestFilter(self.extension_path, allow_patterns=self.request_allowlist)
+                await request_filter.attach(context)
+                self.request_filters[wallet_num] = request_filter
+            page = await context.new_page()
+            return context, page, self.read_saved_mnemonic(wallet_num)
+        
+        if self.wallet_mode == "restore":
+            # Dùng mnemonic đã ghi sẵn (restart cũng giữ phrase cũ)
+            mnemonic = self.read_saved_mnemonic(wallet_num)
+            if not mnemonic:
+                self.pregenerate_mnemonics([wallet_num])
+                mnemonic = self.read_saved_mnemonic(wallet_num)
+        else:
+            mnemonic = await self.create_wallet_mnemonic(wallet_num)
+        
         # Xóa data cũ để tạo wallet mới hoàn toàn
         if user_data.exists():
-            import shutil
             shutil.rmtree(user_data)
-            print(f"✅ Wallet {wallet_num}: Cleaned old browser data")
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Cleaned old browser data")
         
-        user_data.mkdir(parents=True, exist_ok=True)
+        if self.use_profile_template and self.profile_template_ready():
+            # Clone profile mẫu ngoài event loop (copy file là blocking I/O)
+            counts = await asyncio.to_thread(clone_profile, self.profile_template_dir, user_data)
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Cloned golden profile "
+                  f"(reflink {counts['reflink']}, hardlink {counts['hardlink']}, copy {counts['copy']})")
+        else:
+            user_data.mkdir(parents=True, exist_ok=True)
         
         # Tạo context với extension
-        context = await playwright.chromium.launch_persistent_context(
-            user_data_dir=str(user_data),
-            headless=False,
-            args=[
-                f"--disable-extensions-except={self.extension_path}",
-                f"--load-extension={self.extension_path}",
-            ],
-            viewport={"width": 1280, "height": 800},
-            # Tự động cho phép clipboard permission
-            permissions=["clipboard-read", "clipboard-write"],
-        )
+        self.resources.track(wallet_num, user_data)
+        context = await self.launch_context(playwright, user_data)
+        await self.pin_wallet_cpu(wallet_num)
+        
+        self.log(wallet_num, f"✅ Wallet {wallet_num}: Browser launched with Lace extension")
         
-        print(f"✅ Wallet {wallet_num}: Browser launched with Lace extension")
+        if self.block_resources:
+            request_filter = RequestFilter(self.extension_path, allow_patterns=self.request_allowlist)
+            await request_filter.attach(context)
+            self.request_filters[wallet_num] = request_filter
         
         # Tạo page mới
         page = await context.new_page()
         
         return context, page, mnemonic
     
+    async def open_lace_app(self, page, wallet_num):
+        """Mở tab app của Lace và xử lý popup clipboard nếu có"""
+        self.tracer.begin(wallet_num, "extension_open")
+        # Navigate to Lace extension - tăng timeout cho nhiều tab
+        extension_url = f"chrome-extension://{LACE_EXTENSION_ID}/app.html"
+        await page.goto(extension_url, wait_until="domcontentloaded", timeout=90000)
+        
+        self.log(wallet_num, f"✅ Wallet {wallet_num}: Lace extension opened")
+        
+        # Xử lý clipboard permission popup nếu xuất hiện
+        try:
+            allow_btn = await page.query_selector('button:has-text("Allow")')
+            if allow_btn:
+                await allow_btn.click()
+                self.log(wallet_num, f"✅ Wallet {wallet_num}: Allowed clipboard access")
+        except:
+            pass
+    
+    async def unlock_lace_wallet(self, page, wallet_num, password):
+        """Mở Lace trên profile cũ và mở khóa. False nếu profile không còn ví (phải restore lại)
+
+        Lace không hiện màn khóa lẫn màn tạo ví trong 15s -> RuntimeError (không coi là đã mở khóa).
+        """
+        await self.open_lace_app(page, wallet_num)
+        
+        unlock_input = '[data-testid="password-input"]'
+        create_button = '[data-testid="create-wallet-button"]'
+        screen = await self.wait_any(page, [unlock_input, create_button], timeout=15000)
+        self.tracer.begin(wallet_num, "unlock")
+        if screen == create_button:
+            self.log(wallet_num, f"⚠️  Wallet {wallet_num}: No wallet in existing profile", level=logging.WARNING)
+            return False
+        if screen is None:
+            raise RuntimeError("Lace không hiện màn mở khóa sau 15s")
+        await page.fill(unlock_input, password)
+        unlock_btn = await self.wait_enabled(page, 'button:has-text("Unlock")')
+        await unlock_btn.click(timeout=30000)
+        await page.wait_for_selector(unlock_input, state='detached', timeout=30000)
+        self.log(wallet_num, f"✅ Wallet {wallet_num}: Unlocked existing Lace wallet")
+        return True
+    
+    async def finish_wallet_setup(self, page, wallet_num, password):
+        """Trang cuối của create/restore: đặt tên + password rồi đợi Lace tạo xong ví"""
+        self.tracer.begin(wallet_num, "password")
+        # Đợi form password render
+        await page.wait_for_selector('input[type="password"]', state='visible', timeout=60000)
+        
+        # Đặt tên wallet + password + confirm password trong một lần evaluate
+        name_input = ('input[data-testid="wallet-name-input"]', 'input[type="text"]')
+        password_input = ('input[type="password"]',)
+        await self.fill_inputs(page, [
+            (name_input, 0, f"Wallet {wallet_num}"),
+            (password_input, 0, password),  # Password
+            (password_input, 1, password),  # Confirm password
+        ])
+        self.log(wallet_num, f"✅ Wallet {wallet_num}: Set wallet name to Wallet {wallet_num}")
+        self.log(wallet_num, f"✅ Wallet {wallet_num}: Set password")
+        
+        # Click Next/Create để hoàn tất - đợi nút enabled (form hợp lệ)
+        next_selector = '[data-testid="wallet-setup-step-btn-next"]'
+        if not await page.query_selector(next_selector):
+            next_selector = 'button:has-text("Create")'
+        next_button = await self.wait_enabled(page, next_selector, timeout=60000)
+        await next_button.click(timeout=30000)
+        self.log(wallet_num, f"✅ Wallet {wallet_num}: Wallet creation completed!")
+        
+        # Đợi Lace rời khỏi màn hình setup (ví đã được tạo xong)
+        try:
+            await page.wait_for_selector(next_selector, state='detached', timeout=60000)
+        except Exception:
+            self.log(wallet_num, f"⚠️  Wallet {wallet_num}: Setup screen still visible after create, continuing", level=logging.WARNING)
+    
     async def setup_lace_wallet(self, page, mnemonic, wallet_num, password):
         """Tự động tạo wallet trong Lace UI"""
         try:
-            # Navigate to Lace extension - tăng timeout cho nhiều tab
-            extension_url = "chrome-extension://gafhhkghbfjjkeiendhlofajokpaflmk/app.html"
-            await page.goto(extension_url, wait_until="domcontentloaded", timeout=90000)
-            
-            print(f"✅ Wallet {wallet_num}: Lace extension opened")
+            await self.open_lace_app(page, wallet_num)
             
-            # Xử lý clipboard permission popup nếu xuất hiện
-            try:
-                allow_btn = await page.query_selector('button:has-text("Allow")')
-                if allow_btn:
-                    await allow_btn.click()
-                    print(f"✅ Wallet {wallet_num}: Allowed clipboard access")
-                    await asyncio.sleep(1)
-            except:
-                pass
-            
-            # Wait và click nút Create wallet - click ngay khi thấy
-            await page.wait_for_selector('[data-testid="create-wallet-button"]', state='visible', timeout=60000)
-            await asyncio.sleep(1)  # Đợi render và enable
-            await page.click('[data-testid="create-wallet-button"]', timeout=30000, force=True)
-            print(f"✅ Wallet {wallet_num}: Clicked Create Wallet")
-            
-            await asyncio.sleep(2)
+            # Đợi nút Create wallet hiển thị và enabled rồi click ngay
+            self.tracer.begin(wallet_num, "create_click")
+            create_btn = await self.wait_enabled(page, '[data-testid="create-wallet-button"]', timeout=60000)
+            await create_btn.click(timeout=30000, force=True)
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Clicked Create Wallet")
             
             # Bước 0: Chọn Recovery method (Recovery phrase) - có thể không xuất hiện
-            # Thử đợi radio button, nếu không có thì bỏ qua
-            try:
-                await page.wait_for_selector('[data-testid="radio-btn-test-id-mnemonic"]', state='visible', timeout=5000)
-                await asyncio.sleep(0.5)
-                await page.click('[data-testid="radio-btn-test-id-mnemonic"]', timeout=30000)
-                print(f"✅ Wallet {wallet_num}: Selected Recovery phrase method")
-                
-                await asyncio.sleep(1)
-                
-                # Click Next
-                await page.click('[data-testid="wallet-setup-step-btn-next"]', timeout=30000)
-                print(f"✅ Wallet {wallet_num}: Clicked Next (recovery method)")
-                
-                await asyncio.sleep(2)
-            except Exception as e:
-                print(f"⚠️  Wallet {wallet_num}: Recovery method step skipped (may not be needed)")
+            # Đợi màn hình nào tới trước: radio chọn method hoặc trang 24 từ
+            recovery_radio = '[data-testid="radio-btn-test-id-mnemonic"]'
+            writedown_word = '[data-testid="mnemonic-word-writedown"]'
+            first_screen = await self.wait_any(page, [recovery_radio, writedown_word], timeout=60000)
+            if first_screen == recovery_radio:
+                try:
+                    await page.click(recovery_radio, timeout=30000)
+                    self.log(wallet_num, f"✅ Wallet {wallet_num}: Selected Recovery phrase method")
+                    
+                    # Click Next
+                    next_btn = await self.wait_enabled(page, '[data-testid="wallet-setup-step-btn-next"]')
+                    await next_btn.click(timeout=30000)
+                    self.log(wallet_num, f"✅ Wallet {wallet_num}: Clicked Next (recovery method)")
+                except Exception as e:
+                    self.log(wallet_num, f"⚠️  Wallet {wallet_num}: Recovery method step skipped (may not be needed)", level=logging.WARNING)
             
             # Trang 1: Copy 24 từ mnemonic
-            # Đợi nút Next xuất hiện (có 24 từ hiển thị)
-            await page.wait_for_selector('[data-testid="wallet-setup-step-btn-next"]', state='visible', timeout=60000)
-            
-            # Đợi 24 từ load đầy đủ
-            await asyncio.sleep(2)
-            
-            # Lấy 24 từ từ Lace (để lưu vào file - backup)
-            mnemonic_words = []
-            word_elements = await page.query_selector_all('[data-testid="mnemonic-word-writedown"]')
-            
-            # Retry nếu chưa load đủ 24 từ
-            retry_count = 0
-            while len(word_elements) < 24 and retry_count < 5:
-                await asyncio.sleep(1)
-                word_elements = await page.query_selector_all('[data-testid="mnemonic-word-writedown"]')
-                retry_count += 1
-            
-            for word_element in word_elements:
-                word = await word_element.text_content()
-                mnemonic_words.append(word.strip())
+            self.tracer.begin(wallet_num, "mnemonic_capture")
+            # Đợi đủ 24 từ được render và đọc tất cả trong một lần (để lưu vào file - backup)
+            mnemonic_words = await self.read_texts(page, writedown_word, 24)
             
             lace_mnemonic = " ".join(mnemonic_words)
-            print(f"✅ Wallet {wallet_num}: Captured {len(mnemonic_words)} mnemonic words")
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Captured {len(mnemonic_words)} mnemonic words")
             
             # Lưu mnemonic của Lace vào file (thay vì dùng mnemonic tự tạo)
             wallet_dir = self.wallets_dir / f"wallet_{wallet_num}"
@@ -187,405 +2367,398 @@ class PlaywrightLaceBot:
             with open(wallet_dir / "wallet_info.json", "w", encoding="utf-8") as f:
                 json.dump(wallet_info, f, indent=2, ensure_ascii=False)
             
-            print(f"✅ Wallet {wallet_num}: Saved Lace-generated mnemonic (24 words)")
-            print(f"✅ Wallet {wallet_num}: Saved wallet info to wallet_info.json")
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Saved Lace-generated mnemonic (24 words)")
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Saved wallet info to wallet_info.json")
             
             # KHÔNG dùng clipboard nữa vì nhiều tab sẽ conflict
             # Thay vào đó sẽ điền thủ công từng ô
             
             # Click Next
-            await asyncio.sleep(1)
-            await page.click('[data-testid="wallet-setup-step-btn-next"]', timeout=30000)
-            print(f"✅ Wallet {wallet_num}: Clicked Next (copied mnemonic)")
-            
-            await asyncio.sleep(2)
+            self.tracer.begin(wallet_num, "mnemonic_confirm")
+            next_btn = await self.wait_enabled(page, '[data-testid="wallet-setup-step-btn-next"]')
+            await next_btn.click(timeout=30000)
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Clicked Next (copied mnemonic)")
             
             # Trang 2: Điền mnemonic thủ công để xác nhận (không dùng paste)
             await page.wait_for_selector('input[data-testid="mnemonic-word-input"]', state='visible', timeout=60000)
             
-            # Điền từng từ vào từng ô input
-            for idx, word in enumerate(mnemonic_words):
-                # Input fields có thể có data-testid hoặc name attribute
-                input_selector = f'input[data-testid="mnemonic-word-input"]:nth-of-type({idx + 1})'
-                input_field = await page.query_selector(input_selector)
-                
-                if not input_field:
-                    # Thử selector khác
-                    all_inputs = await page.query_selector_all('input[data-testid="mnemonic-word-input"]')
-                    if idx < len(all_inputs):
-                        input_field = all_inputs[idx]
-                
-                if input_field:
-                    await input_field.fill(word)
-            
-            print(f"✅ Wallet {wallet_num}: Filled all {len(mnemonic_words)} words manually")
+            # Điền cả 24 ô trong một lần evaluate (kèm event input để Lace nhận giá trị)
+            word_input = ('input[data-testid="mnemonic-word-input"]',)
+            filled = await self.fill_inputs(page, [(word_input, idx, word) for idx, word in enumerate(mnemonic_words)])
             
-            await asyncio.sleep(1)
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Filled {filled}/{len(mnemonic_words)} words")
             
-            # Click Next
-            await page.click('[data-testid="wallet-setup-step-btn-next"]', timeout=30000)
-            print(f"✅ Wallet {wallet_num}: Confirmed mnemonic")
-            
-            await asyncio.sleep(2)
+            # Click Next - nút chỉ enable khi Lace đã chấp nhận đủ 24 từ
+            next_btn = await self.wait_enabled(page, '[data-testid="wallet-setup-step-btn-next"]')
+            await next_btn.click(timeout=30000)
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Confirmed mnemonic")
             
             # Trang 3: Đặt tên wallet và password
-            # Đặt tên wallet
-            wallet_name_input = await page.query_selector('input[data-testid="wallet-name-input"]')
-            if not wallet_name_input:
-                wallet_name_input = await page.query_selector('input[type="text"]')
-            
-            if wallet_name_input:
-                await wallet_name_input.fill(f"Wallet {wallet_num}")
-                print(f"✅ Wallet {wallet_num}: Set wallet name to Wallet {wallet_num}")
-            
-            # Điền password
-            await asyncio.sleep(0.5)
-            password_inputs = await page.query_selector_all('input[type="password"]')
-            if len(password_inputs) >= 2:
-                await password_inputs[0].fill(password)  # Password
-                await password_inputs[1].fill(password)  # Confirm password
-                print(f"✅ Wallet {wallet_num}: Set password")
-            
-            await asyncio.sleep(1)
-            
-            # Click Next/Create để hoàn tất - đợi lâu hơn vì có nhiều tab
-            await page.wait_for_selector('[data-testid="wallet-setup-step-btn-next"]', state='visible', timeout=60000)
-            await asyncio.sleep(1)
-            next_button = await page.query_selector('[data-testid="wallet-setup-step-btn-next"]')
-            if not next_button:
-                next_button = await page.query_selector('button:has-text("Create")')
-            
-            if next_button:
-                await next_button.click(timeout=30000)
-                print(f"✅ Wallet {wallet_num}: Wallet creation completed!")
+            await self.finish_wallet_setup(page, wallet_num, password)
             
             return True
             
         except Exception as e:
-            print(f"❌ Wallet {wallet_num}: Error setting up Lace - {e}")
-            import traceback
-            traceback.print_exc()
+            self.tracer.fail(wallet_num, e)
+            self.log(wallet_num, f"❌ Wallet {wallet_num}: Error setting up Lace - {e}", exc_info=True, level=logging.ERROR)
             return False
     
-    async def connect_to_mining_site(self, page, wallet_num):
-        """Kết nối wallet với sm.midnight.gd và đăng ký mining"""
+    async def restore_lace_wallet(self, page, mnemonic, wallet_num, password):
+        """Tạo wallet trong Lace qua luồng Restore với mnemonic đã sinh sẵn (bỏ qua trang ghi/xác nhận 24 từ)"""
         try:
-            # Mở tab mới cho mining site
-            mining_page = await page.context.new_page()
+            await self.open_lace_app(page, wallet_num)
+            
+            # Click Restore wallet
+            self.tracer.begin(wallet_num, "restore_click")
+            restore_selector = await self.wait_any(
+                page,
+                ['[data-testid="restore-wallet-button"]', 'button:has-text("Restore")'],
+                timeout=60000,
+            )
+            if not restore_selector:
+                raise RuntimeError("Restore wallet button not found")
+            restore_btn = await self.wait_enabled(page, restore_selector)
+            await restore_btn.click(timeout=30000, force=True)
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Clicked Restore Wallet")
+            
+            # Chọn Recovery phrase nếu Lace hỏi method
+            recovery_radio = '[data-testid="radio-btn-test-id-mnemonic"]'
+            word_input = 'input[data-testid="mnemonic-word-input"]'
+            first_screen = await self.wait_any(page, [recovery_radio, word_input], timeout=60000)
+            if first_screen == recovery_radio:
+                await page.click(recovery_radio, timeout=30000)
+                next_btn = await self.wait_enabled(page, '[data-testid="wallet-setup-step-btn-next"]')
+                await next_btn.click(timeout=30000)
+                self.log(wallet_num, f"✅ Wallet {wallet_num}: Selected Recovery phrase method")
+            
+            # Điền mnemonic - Lace có thể hiện đủ 24 ô hoặc chia nhiều trang
+            self.tracer.begin(wallet_num, "mnemonic_enter")
+            words = mnemonic.split()
+            offset = 0
+            while offset < len(words):
+                await page.wait_for_selector(word_input, state='visible', timeout=60000)
+                count = await page.locator(word_input).count()
+                chunk = words[offset:offset + count]
+                await self.fill_inputs(page, [((word_input,), idx, word) for idx, word in enumerate(chunk)])
+                offset += len(chunk)
+                
+                next_btn = await self.wait_enabled(page, '[data-testid="wallet-setup-step-btn-next"]')
+                await next_btn.click(timeout=30000)
+                if offset < len(words):
+                    # Đợi trang kế tiếp thay các ô đã điền
+                    await page.wait_for_function(
+                        "([sel, first]) => { const el = document.querySelector(sel); return !el || el.value !== first; }",
+                        arg=[word_input, chunk[0]],
+                        timeout=30000,
+                    )
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Entered {len(words)} recovery words")
+            
+            # Đặt tên wallet và password
+            await self.finish_wallet_setup(page, wallet_num, password)
+            
+            return True
             
-            # Kiểm tra response để bắt lỗi 429
-            response = await mining_page.goto("https://sm.midnight.gd", wait_until="domcontentloaded", timeout=90000)
+        except Exception as e:
+            self.tracer.fail(wallet_num, e)
+            self.log(wallet_num, f"❌ Wallet {wallet_num}: Error restoring Lace wallet - {e}", exc_info=True, level=logging.ERROR)
+            return False
+    
+    async def sign_data_popup(self, popup_page, wallet_num, label="", settle_seconds=5):
+        """Xác nhận popup Confirm Data của Lace: Confirm -> nhập password -> Sign -> đóng popup"""
+        # Bước 1: Click Confirm (dapp-transaction-confirm) - đợi visible + enabled
+        confirm_btn = await self.wait_enabled(popup_page, '[data-testid="dapp-transaction-confirm"]', timeout=10000)
+        await confirm_btn.click(timeout=30000)
+        self.log(wallet_num, f"✅ Wallet {wallet_num}: {label}Clicked Confirm")
+        
+        # Bước 2: Nhập password
+        await popup_page.wait_for_selector('[data-testid="password-input"]', state='visible', timeout=10000)
+        await popup_page.fill('[data-testid="password-input"]', self.wallet_password(wallet_num))
+        self.log(wallet_num, f"✅ Wallet {wallet_num}: {label}Entered password")
+        
+        # Bước 3: Click Confirm để sign (sign-transaction-confirm) - enable khi password hợp lệ
+        sign_confirm_btn = await self.wait_enabled(popup_page, '[data-testid="sign-transaction-confirm"]', timeout=10000)
+        await sign_confirm_btn.click(timeout=30000)
+        self.log(wallet_num, f"✅ Wallet {wallet_num}: {label}Clicked Sign")
+        
+        # Đợi signature được gửi - QUAN TRỌNG!
+        # Tín hiệu: popup tự đóng hoặc nút sign biến mất
+        try:
+            await popup_page.wait_for_selector('[data-testid="sign-transaction-confirm"]', state='hidden', timeout=10000)
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: {label}Sign button hidden, closing popup...")
+        except:
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: {label}Timeout waiting for auto-close, closing manually...", level=logging.WARNING)
+        await self.settle(settle_seconds)
+        
+        # Đóng popup
+        try:
+            if not popup_page.is_closed():
+                await popup_page.close()
+                self.log(wallet_num, f"✅ Wallet {wallet_num}: {label}Closed Sign popup successfully")
+        except Exception as e:
+            self.log(wallet_num, f"⚠️  Wallet {wallet_num}: {label}Could not close Sign popup - {e}", level=logging.WARNING)
+    
+    async def open_mining_site(self, context, wallet_num, mining_page=None):
+        """Mở site mining (tab mới, hoặc tải lại mining_page) và ghi nhận 429 từ site
+
+        Trả về (mining_page, response, rate_limited, on_response): rate_limited là list Retry-After
+        của mọi 429 mà on_response (còn gắn trên tab) đã thấy. Lỗi thì gỡ listener / đóng tab vừa mở.
+        """
+        rate_limited = []
+        
+        def on_response(response):
+            if response.status == 429 and self.mining_site_host in response.url:
+                retry_after = parse_retry_after(response.headers.get("retry-after"))
+                rate_limited.append(retry_after)
+                # Báo controller ngay để các ví khác giảm tốc, không đợi ví này fail
+                self.rate_controller.on_rate_limited(retry_after)
+        
+        created = mining_page is None
+        if created:
+            mining_page = await context.new_page()
+        mining_page.on("response", on_response)
+        try:
+            response = await mining_page.goto(self.mining_site_url, wait_until="domcontentloaded", timeout=90000)
+        except BaseException:
+            mining_page.remove_listener("response", on_response)
+            if created:
+                try:
+                    await mining_page.close()
+                except Exception:
+                    pass
+            raise
+        return mining_page, response, rate_limited, on_response
+    
+    def prefetch_mining_site(self, context, wallet_num):
+        """Tải site mining ở tab riêng trong lúc Lace còn đang tạo / mở khóa ví (task nền)"""
+        if not self.prefetch_site:
+            return None
+        task = asyncio.create_task(self.open_mining_site(context, wallet_num))
+        # Task bị bỏ (ví lỗi trước khi kết nối) không để lại cảnh báo "exception never retrieved"
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+    
+    async def discard_prefetch(self, prefetch):
+        """Bỏ prefetch không được connect_to_mining_site dùng: hủy task đang tải, hoặc gỡ listener 429 + đóng tab đã tải xong"""
+        if prefetch is None:
+            return
+        if not prefetch.done():
+            prefetch.cancel()
+            return
+        if prefetch.cancelled() or prefetch.exception() is not None:
+            return  # open_mining_site đã tự dọn tab
+        mining_page, _, _, on_response = prefetch.result()
+        # Tab mồ côi không được báo 429 cho cả fleet nữa
+        mining_page.remove_listener("response", on_response)
+        try:
+            await mining_page.close()
+        except Exception:
+            pass
+    
+    async def connect_to_mining_site(self, page, wallet_num, mining_page=None, prefetch=None):
+        """Kết nối wallet với sm.midnight.gd và đăng ký mining
+
+        mining_page: tab mining sẵn có (soft restart) - tải lại trong tab đó thay vì mở tab mới.
+        prefetch: task prefetch_mining_site - dùng tab đã tải sẵn, chỉ kết nối ví khi tới đây (ví đã sẵn sàng).
+        """
+        # Bắt đầu nghe page mới trước khi bất kỳ popup nào có thể mở
+        popups = LacePopupTracker(page.context)
+        # Retry-After của mọi 429 từ site trong lần kết nối này
+        rate_limited = []
+        on_response = None
+        
+        try:
+            # Mở tab mới cho mining site (soft restart: dùng lại tab cũ; prefetch: đợi tab đã tải sẵn)
+            self.tracer.begin(wallet_num, "site_open")
+            opened = None
+            if prefetch is not None:
+                try:
+                    opened = await prefetch
+                    self.log(wallet_num, f"⚡ Wallet {wallet_num}: Using prefetched mining site")
+                except Exception as e:
+                    # Prefetch lỗi (timeout, tab bị đóng...) - tải lại như bình thường
+                    self.log(wallet_num, f"⚠️  Wallet {wallet_num}: Prefetch failed, reloading site - {type(e).__name__} {e}", level=logging.WARNING)
+            if opened is None:
+                opened = await self.open_mining_site(page.context, wallet_num, mining_page)
+            mining_page, response, rate_limited, on_response = opened
             
             # Kiểm tra status code
             if response and response.status == 429:
-                error_msg = "429 Too many requests - Server đang giới hạn request"
-                print(f"❌ Wallet {wallet_num}: {error_msg}")
-                # Lưu lỗi vào state
-                if wallet_num in self.wallet_states:
-                    self.wallet_states[wallet_num]["error"] = error_msg
-                    self.wallet_states[wallet_num]["status"] = "failed"
-                    self.save_wallet_states()
-                return False
+                raise RateLimited("429 Too many requests - Server đang giới hạn request",
+                                  retry_after=parse_retry_after(response.headers.get("retry-after")))
             
-            print(f"✅ Wallet {wallet_num}: Opened mining site (Status: {response.status if response else 'Unknown'})")
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Opened mining site (Status: {response.status if response else 'Unknown'})")
             
             # Kiểm tra nội dung trang có chứa thông báo lỗi 429
             page_content = await mining_page.content()
             if "429" in page_content or "too many requests" in page_content.lower():
-                error_msg = "429 Too many requests detected in page content"
-                print(f"❌ Wallet {wallet_num}: {error_msg}")
-                if wallet_num in self.wallet_states:
-                    self.wallet_states[wallet_num]["error"] = error_msg
-                    self.wallet_states[wallet_num]["status"] = "failed"
-                    self.save_wallet_states()
-                return False
+                self.rate_controller.on_rate_limited()
+                raise RateLimited("429 Too many requests detected in page content")
             
-            await asyncio.sleep(3)
-            
-            # Click "Get started"
-            get_started_btn = await mining_page.query_selector('button:has-text("Get started")')
-            if get_started_btn:
-                await get_started_btn.click()
-                print(f"✅ Wallet {wallet_num}: Clicked Get started")
-                await asyncio.sleep(3)
+            # Click "Get started" - đợi app render (nút Get started hoặc đã ở màn chọn ví)
+            get_started_selector = 'button:has-text("Get started")'
+            lace_selector = 'button:has-text("Lace")'
+            first_screen = await self.wait_any(mining_page, [get_started_selector, lace_selector], timeout=30000)
+            if first_screen == get_started_selector:
+                await mining_page.click(get_started_selector, timeout=30000)
+                self.log(wallet_num, f"✅ Wallet {wallet_num}: Clicked Get started")
             
             # Click vào Lace wallet (radio button với INSTALLED badge)
-            # Đợi nút enable (có thể mất thời gian)
-            await asyncio.sleep(2)
-            lace_btn = await mining_page.query_selector('button:has-text("Lace")')
-            if lace_btn:
-                # Đợi nút enabled
-                for i in range(30):  # Thử 30 lần, mỗi lần 1s
-                    is_enabled = await lace_btn.is_enabled()
-                    if is_enabled:
-                        break
-                    await asyncio.sleep(1)
-                
+            # Đợi nút enable (extension inject xong) thay vì poll is_enabled mỗi 1s
+            try:
+                lace_btn = await self.wait_enabled(mining_page, lace_selector, timeout=30000)
                 await lace_btn.click(timeout=30000)
-                print(f"✅ Wallet {wallet_num}: Selected Lace wallet")
-                await asyncio.sleep(2)
+                self.log(wallet_num, f"✅ Wallet {wallet_num}: Selected Lace wallet")
+            except Exception as e:
+                self.log(wallet_num, f"⚠️  Wallet {wallet_num}: Lace wallet button not ready - {e}", level=logging.WARNING)
             
             # Click Continue
-            continue_btn = await mining_page.query_selector('button:has-text("Continue")')
-            if continue_btn:
+            try:
+                continue_btn = await self.wait_enabled(mining_page, 'button:has-text("Continue")', timeout=15000)
                 await continue_btn.click()
-                print(f"✅ Wallet {wallet_num}: Clicked Continue")
-                await asyncio.sleep(3)
+                self.log(wallet_num, f"✅ Wallet {wallet_num}: Clicked Continue")
+            except Exception:
+                pass
             
             # Popup Lace: Authorize DApp - mở trong window riêng
-            # Đợi popup window xuất hiện - đợi lâu hơn với nhiều tab
-            await asyncio.sleep(3)
-            
-            # Tìm popup window - thử nhiều lần
-            popup_page = None
-            for attempt in range(10):  # Thử 10 lần, mỗi lần 1s
-                for p in page.context.pages:
-                    url = p.url
-                    if "lace-popup" in url or "chrome-extension://gafhhkghbfjjkeiendhlofajokpaflmk" in url:
-                        # Kiểm tra nếu page có nút Authorize
-                        try:
-                            authorize_check = await p.query_selector('[data-testid="connect-authorize-button"]')
-                            if authorize_check:
-                                popup_page = p
-                                break
-                        except:
-                            pass
-                if popup_page:
-                    break
-                await asyncio.sleep(1)
+            # Tracker nhận popup ngay khi context mở page mới, không quét tab
+            authorize_selector = '[data-testid="connect-authorize-button"]'
+            self.tracer.begin(wallet_num, "authorize")
+            if self.step_done(wallet_num, "dapp_authorized"):
+                # Đã chọn "Always" ở lần trước - Lace thường không hỏi lại, nhưng vẫn xử lý nếu popup mở
+                popup_page = await self.wait_popup_or_selector(
+                    popups, authorize_selector, mining_page, 'button:has-text("Next")')
+            else:
+                popup_page = await popups.wait_for_popup(authorize_selector, timeout=self.popup_timeout)
             
             if popup_page:
-                print(f"✅ Wallet {wallet_num}: Found Lace popup window")
-                # Click Authorize - đợi visible
-                await popup_page.wait_for_selector('[data-testid="connect-authorize-button"]', state='visible', timeout=10000)
-                await asyncio.sleep(0.5)
-                authorize_btn = await popup_page.query_selector('[data-testid="connect-authorize-button"]')
-                if authorize_btn:
-                    await authorize_btn.click(timeout=30000)
-                    print(f"✅ Wallet {wallet_num}: Clicked Authorize")
-                    await asyncio.sleep(2)
+                self.log(wallet_num, f"✅ Wallet {wallet_num}: Found Lace popup window")
+                
+                # Click Authorize - đợi visible + enabled
+                authorize_btn = await self.wait_enabled(popup_page, authorize_selector, timeout=10000)
+                await authorize_btn.click(timeout=30000)
+                self.log(wallet_num, f"✅ Wallet {wallet_num}: Clicked Authorize")
                 
-                # Click Always (nếu có)
-                always_btn = await popup_page.query_selector('button:has-text("Always")')
-                if always_btn:
-                    await always_btn.click(timeout=30000)
-                    await asyncio.sleep(1)
+                # Click Always (nếu có) - đợi có giới hạn thay vì sleep cố định
+                try:
+                    await popup_page.click('button:has-text("Always")', timeout=5000)
+                except Exception:
+                    pass
                 
                 # Đóng popup sau khi authorize thành công
                 try:
                     await popup_page.close()
-                    print(f"✅ Wallet {wallet_num}: Closed Authorize popup")
+                    self.log(wallet_num, f"✅ Wallet {wallet_num}: Closed Authorize popup")
                 except Exception as e:
-                    print(f"⚠️  Wallet {wallet_num}: Could not close Authorize popup - {e}")
-            
-            # Quay lại main page, click Next - đợi visible
-            await mining_page.wait_for_selector('button:has-text("Next")', state='visible', timeout=60000)
-            await asyncio.sleep(1)
-            next_btn = await mining_page.query_selector('button:has-text("Next")')
-            if next_btn:
-                await next_btn.click(timeout=30000)
-                print(f"✅ Wallet {wallet_num}: Clicked Next (after wallet connect)")
-                await asyncio.sleep(3)
-            
-            # Accept terms: Tick checkbox
-            checkbox = await mining_page.query_selector('#accept-terms')
-            if checkbox:
-                await checkbox.click()
-                print(f"✅ Wallet {wallet_num}: Checked terms checkbox")
-                await asyncio.sleep(1)
-            
-            # Click "Accept and sign"
-            accept_sign_btn = await mining_page.query_selector('button:has-text("Accept and sign")')
-            if accept_sign_btn:
-                await accept_sign_btn.click()
-                print(f"✅ Wallet {wallet_num}: Clicked Accept and sign")
-                await asyncio.sleep(3)
-            
-            # Popup Lace: Confirm Data
-            await asyncio.sleep(3)
-            
-            # Tìm popup window cho Confirm Data - thử nhiều lần
-            popup_page = None
-            for attempt in range(10):
-                for p in page.context.pages:
-                    url = p.url
-                    if "lace-popup" in url or "chrome-extension://gafhhkghbfjjkeiendhlofajokpaflmk" in url:
-                        try:
-                            confirm_check = await p.query_selector('[data-testid="dapp-transaction-confirm"]')
-                            if confirm_check:
-                                popup_page = p
-                                break
-                        except:
-                            pass
-                if popup_page:
-                    break
-                await asyncio.sleep(1)
-            
-            if popup_page:
-                print(f"✅ Wallet {wallet_num}: Found Lace Confirm Data popup")
-                
-                # Bước 1: Click Confirm (dapp-transaction-confirm) - đợi visible
-                await popup_page.wait_for_selector('[data-testid="dapp-transaction-confirm"]', state='visible', timeout=10000)
-                await asyncio.sleep(0.5)
-                confirm_btn = await popup_page.query_selector('[data-testid="dapp-transaction-confirm"]')
-                if confirm_btn:
-                    await confirm_btn.click(timeout=30000)
-                    print(f"✅ Wallet {wallet_num}: Clicked Confirm (step 1)")
-                    await asyncio.sleep(2)
-                
-                # Bước 2: Nhập password
-                await popup_page.wait_for_selector('[data-testid="password-input"]', state='visible', timeout=10000)
-                password_input = await popup_page.query_selector('[data-testid="password-input"]')
-                if password_input:
-                    await password_input.fill(self.password)
-                    print(f"✅ Wallet {wallet_num}: Entered password")
-                    await asyncio.sleep(1)
-                
-                # Bước 3: Click Confirm để sign (sign-transaction-confirm)
-                await popup_page.wait_for_selector('[data-testid="sign-transaction-confirm"]', state='visible', timeout=10000)
-                await asyncio.sleep(0.5)
-                sign_confirm_btn = await popup_page.query_selector('[data-testid="sign-transaction-confirm"]')
-                if sign_confirm_btn:
-                    await sign_confirm_btn.click(timeout=30000)
-                    print(f"✅ Wallet {wallet_num}: Clicked Sign button")
-                    
-                    # Đợi signature được gửi - QUAN TRỌNG!
-                    await asyncio.sleep(5)
-                    
-                    print(f"✅ Wallet {wallet_num}: Signed message - Registration completed!")
-                
-                # Đợi popup tự đóng hoặc đóng thủ công
+                    self.log(wallet_num, f"⚠️  Wallet {wallet_num}: Could not close Authorize popup - {e}", level=logging.WARNING)
+            else:
+                self.log(wallet_num, f"✅ Wallet {wallet_num}: DApp already authorized")
+            
+            # Quay lại main page, click Next - đợi visible + enabled
+            next_btn = await self.wait_enabled(mining_page, 'button:has-text("Next")', timeout=60000)
+            await next_btn.click(timeout=30000)
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Clicked Next (after wallet connect)")
+            self.mark_step(wallet_num, "dapp_authorized")
+            
+            # Địa chỉ đã ký ở lần trước: site có thể đi thẳng tới "Start session"
+            start_session_selector = 'button:has-text("Start session")'
+            self.tracer.begin(wallet_num, "sign")
+            signature_needed = True
+            if self.step_done(wallet_num, "message_signed"):
+                first_screen = await self.wait_any(mining_page, ['#accept-terms', start_session_selector], timeout=30000)
+                signature_needed = first_screen != start_session_selector
+                if not signature_needed:
+                    self.log(wallet_num, f"✅ Wallet {wallet_num}: Message already signed, skipping signature")
+            
+            if signature_needed:
+                # Accept terms: Tick checkbox - đợi trang điều khoản render
                 try:
-                    # Đợi button biến mất (popup đóng)
-                    await popup_page.wait_for_selector('[data-testid="sign-transaction-confirm"]', state='hidden', timeout=10000)
-                    print(f"✅ Wallet {wallet_num}: Sign button hidden, closing popup...")
-                except:
-                    print(f"✅ Wallet {wallet_num}: Timeout waiting for auto-close, closing manually...")
-                
-                # Đóng popup
+                    await mining_page.wait_for_selector('#accept-terms', state='visible', timeout=30000)
+                    await mining_page.click('#accept-terms')
+                    self.log(wallet_num, f"✅ Wallet {wallet_num}: Checked terms checkbox")
+                except Exception:
+                    pass
+            
+                # Click "Accept and sign" - nút enable sau khi tick checkbox
                 try:
-                    if not popup_page.is_closed():
-                        await popup_page.close()
-                        print(f"✅ Wallet {wallet_num}: Closed Sign popup successfully")
-                except Exception as e:
-                    print(f"⚠️  Wallet {wallet_num}: Could not close Sign popup - {e}")
+                    accept_sign_btn = await self.wait_enabled(mining_page, 'button:has-text("Accept and sign")', timeout=15000)
+                    await accept_sign_btn.click()
+                    self.log(wallet_num, f"✅ Wallet {wallet_num}: Clicked Accept and sign")
+                except Exception:
+                    pass
             
-            # Quay lại trang chính, click "Start session" - đợi lâu hơn
-            await asyncio.sleep(5)  # Đợi signature xử lý
+                # Popup Lace: Confirm Data
+                popup_page = await popups.wait_for_popup('[data-testid="dapp-transaction-confirm"]', timeout=self.popup_timeout)
+                self.log(wallet_num, f"✅ Wallet {wallet_num}: Found Lace Confirm Data popup")
+                await self.sign_data_popup(popup_page, wallet_num)
+                self.log(wallet_num, f"✅ Wallet {wallet_num}: Signed message - Registration completed!")
+                self.mark_step(wallet_num, "message_signed")
             
-            # Kiểm tra error message trước
-            try:
-                error_msg = await mining_page.query_selector('text=We could not find the signed message')
-                if error_msg:
-                    print(f"❌ Wallet {wallet_num}: Signature not found - retrying...")
-                    
-                    # Đợi trang reset
-                    await asyncio.sleep(3)
+                # Quay lại trang chính - đợi site xử lý signature:
+                # hoặc hiện "Start session", hoặc báo không tìm thấy signed message
+                signature_error_selector = 'text=We could not find the signed message'
+                outcome = await self.wait_any(mining_page, [start_session_selector, signature_error_selector], timeout=60000)
+            
+                # Kiểm tra error message trước
+                try:
+                    if outcome == signature_error_selector:
+                        self.log(wallet_num, f"❌ Wallet {wallet_num}: Signature not found - retrying...", level=logging.ERROR)
                     
-                    # Retry: Tìm button "Accept and sign" hoặc "Sign"
-                    accept_sign_btn = await mining_page.query_selector('button:has-text("Accept and sign")')
-                    if not accept_sign_btn:
-                        accept_sign_btn = await mining_page.query_selector('button:has-text("Sign")')
+                        # Retry: Đợi trang reset về nút "Accept and sign" hoặc "Sign"
+                        retry_selector = await self.wait_any(
+                            mining_page,
+                            ['button:has-text("Accept and sign")', 'button:has-text("Sign")'],
+                            timeout=15000,
+                        )
                     
-                    if accept_sign_btn:
-                        # Check checkbox lại nếu cần
-                        checkbox = await mining_page.query_selector('#accept-terms')
-                        if checkbox:
-                            is_checked = await checkbox.is_checked()
-                            if not is_checked:
-                                await checkbox.click()
-                                await asyncio.sleep(1)
+                        if retry_selector:
+                            # Check checkbox lại nếu cần
+                            checkbox = await mining_page.query_selector('#accept-terms')
+                            if checkbox:
+                                is_checked = await checkbox.is_checked()
+                                if not is_checked:
+                                    await checkbox.click()
                         
-                        await accept_sign_btn.click(timeout=30000)
-                        print(f"✅ Wallet {wallet_num}: Retry - Clicked Accept and sign")
-                        await asyncio.sleep(3)
+                            accept_sign_btn = await self.wait_enabled(mining_page, retry_selector)
+                            await accept_sign_btn.click(timeout=30000)
+                            self.log(wallet_num, f"✅ Wallet {wallet_num}: Retry - Clicked Accept and sign")
                         
-                        # Tìm popup lại
-                        popup_page = None
-                        for attempt in range(10):
-                            for p in page.context.pages:
-                                url = p.url
-                                if "lace-popup" in url or "chrome-extension://gafhhkghbfjjkeiendhlofajokpaflmk" in url:
-                                    try:
-                                        confirm_check = await p.query_selector('[data-testid="dapp-transaction-confirm"]')
-                                        if confirm_check:
-                                            popup_page = p
-                                            break
-                                    except:
-                                        pass
-                            if popup_page:
-                                break
-                            await asyncio.sleep(1)
-                        
-                        if popup_page:
-                            # Retry signing
-                            print(f"✅ Wallet {wallet_num}: Retry - Found popup")
-                            await popup_page.wait_for_selector('[data-testid="dapp-transaction-confirm"]', state='visible', timeout=10000)
-                            await asyncio.sleep(0.5)
-                            confirm_btn = await popup_page.query_selector('[data-testid="dapp-transaction-confirm"]')
-                            if confirm_btn:
-                                await confirm_btn.click(timeout=30000)
-                                print(f"✅ Wallet {wallet_num}: Retry - Clicked Confirm")
-                                await asyncio.sleep(2)
-                            
-                            password_input = await popup_page.query_selector('[data-testid="password-input"]')
-                            if password_input:
-                                await password_input.fill(self.password)
-                                print(f"✅ Wallet {wallet_num}: Retry - Entered password")
-                                await asyncio.sleep(1)
-                            
-                            sign_confirm_btn = await popup_page.query_selector('[data-testid="sign-transaction-confirm"]')
-                            if sign_confirm_btn:
-                                await sign_confirm_btn.click(timeout=30000)
-                                print(f"✅ Wallet {wallet_num}: Retry - Clicked Sign")
-                                await asyncio.sleep(7)  # Đợi lâu hơn
-                                print(f"✅ Wallet {wallet_num}: Retry - Signed successfully")
-                            
-                            # Đóng popup sau khi retry thành công
-                            try:
-                                await popup_page.wait_for_selector('[data-testid="sign-transaction-confirm"]', state='hidden', timeout=10000)
-                                print(f"✅ Wallet {wallet_num}: Retry - Sign button hidden, closing popup...")
-                            except:
-                                print(f"✅ Wallet {wallet_num}: Retry - Timeout waiting for auto-close, closing manually...")
-                            
-                            # Đóng popup
-                            try:
-                                if not popup_page.is_closed():
-                                    await popup_page.close()
-                                    print(f"✅ Wallet {wallet_num}: Retry - Closed Sign popup successfully")
-                            except Exception as e:
-                                print(f"⚠️  Wallet {wallet_num}: Retry - Could not close Sign popup - {e}")
-                            
-                            await asyncio.sleep(5)
-                    else:
-                        print(f"⚠️ Wallet {wallet_num}: Retry failed - No popup found after 10 attempts")
-                else:
-                    print(f"⚠️  Wallet {wallet_num}: Retry failed - Accept and sign button not found")
-            except Exception as retry_error:
-                print(f"⚠️  Wallet {wallet_num}: Retry error - {retry_error}")
+                            # Tìm popup lại
+                            popup_page = await popups.wait_for_popup('[data-testid="dapp-transaction-confirm"]', timeout=self.popup_timeout)
+                            self.log(wallet_num, f"✅ Wallet {wallet_num}: Retry - Found popup")
+                            await self.sign_data_popup(popup_page, wallet_num, label="Retry - ", settle_seconds=7)
+                            self.log(wallet_num, f"✅ Wallet {wallet_num}: Retry - Signed successfully")
+                        else:
+                            self.log(wallet_num, f"⚠️  Wallet {wallet_num}: Retry failed - Accept and sign button not found", level=logging.WARNING)
+                except Exception as retry_error:
+                    self.log(wallet_num, f"⚠️  Wallet {wallet_num}: Retry error - {retry_error}", level=logging.WARNING)
             
             # Click "Start session" - nếu có
+            self.tracer.begin(wallet_num, "start_session")
             try:
-                await mining_page.wait_for_selector('button:has-text("Start session")', state='visible', timeout=60000)
-                await asyncio.sleep(1)
-                start_session_btn = await mining_page.query_selector('button:has-text("Start session")')
-                if start_session_btn:
-                    await start_session_btn.click(timeout=30000)
-                    print(f"✅ Wallet {wallet_num}: Started mining session!")
-                    await asyncio.sleep(3)
+                start_session_btn = await self.wait_enabled(mining_page, start_session_selector, timeout=60000)
+                await start_session_btn.click(timeout=30000)
+                self.log(wallet_num, f"✅ Wallet {wallet_num}: Started mining session!")
+                self.mark_step(wallet_num, "session_started")
+                # Đợi site nhận lệnh: nút Start session biến mất
+                try:
+                    await mining_page.wait_for_selector(start_session_selector, state='hidden', timeout=15000)
+                except Exception:
+                    pass
             except Exception as e:
-                print(f"⚠️  Wallet {wallet_num}: Could not start session - {e}")
-                print(f"⚠️  Wallet {wallet_num}: Signature may have failed, skipping this wallet")
+                self.log(wallet_num, f"⚠️  Wallet {wallet_num}: Could not start session - {e}", level=logging.WARNING)
+                self.log(wallet_num, f"⚠️  Wallet {wallet_num}: Signature may have failed, skipping this wallet", level=logging.WARNING)
+                self.tracer.fail(wallet_num, e)
                 return False
             
             # Dọn dẹp: Đóng các tab không cần thiết
+            self.tracer.begin(wallet_num, "cleanup")
             for p in page.context.pages:
                 url = p.url
                 # Giữ lại tab mining, đóng các tab khác (bao gồm popup windows)
-                if "about:blank" in url or "chrome-extension://gafhhkghbfjjkeiendhlofajokpaflmk/app.html" in url or "lace-popup" in url:
+                if "about:blank" in url or f"chrome-extension://{LACE_EXTENSION_ID}/app.html" in url or "lace-popup" in url:
                     try:
                         await p.close()
-                        print(f"✅ Wallet {wallet_num}: Closed unnecessary tab: {url[:50]}...")
+                        self.log(wallet_num, f"✅ Wallet {wallet_num}: Closed unnecessary tab: {url[:50]}...")
                     except:
                         pass
             
@@ -593,103 +2766,181 @@ class PlaywrightLaceBot:
             try:
                 all_pages = page.context.pages
                 for p in all_pages:
-                    if p != mining_page and "sm.midnight.gd" not in p.url:
+                    if p != mining_page and self.mining_site_host not in p.url:
                         try:
                             if not p.is_closed():
                                 await p.close()
-                                print(f"✅ Wallet {wallet_num}: Closed remaining popup/tab")
+                                self.log(wallet_num, f"✅ Wallet {wallet_num}: Closed remaining popup/tab")
                         except:
                             pass
             except Exception as e:
-                print(f"⚠️  Wallet {wallet_num}: Error during cleanup - {e}")
+                self.log(wallet_num, f"⚠️  Wallet {wallet_num}: Error during cleanup - {e}", level=logging.WARNING)
             
-            print(f"✅ Wallet {wallet_num}: Connected and registered successfully")
+            self.log(wallet_num, f"✅ Wallet {wallet_num}: Connected and registered successfully", summary=True)
+            self.tracer.end(wallet_num)
+            self.session_monitor.watch(wallet_num, mining_page)
             return True
             
+        except RateLimited as e:
+            self.log(wallet_num, f"❌ Wallet {wallet_num}: {e}", level=logging.ERROR)
+            self.tracer.fail(wallet_num, e)
+            raise
         except Exception as e:
             error_message = str(e)
+            self.tracer.fail(wallet_num, e)
             
-            # Kiểm tra lỗi 429
-            if "429" in error_message or "too many requests" in error_message.lower():
+            # Kiểm tra lỗi 429 - bước nào đó fail vì site đang giới hạn request
+            if rate_limited or "429" in error_message or "too many requests" in error_message.lower():
                 error_msg = "429 Too many requests - Server đang giới hạn request"
-                print(f"❌ Wallet {wallet_num}: {error_msg}")
-                # Lưu lỗi vào state
-                if wallet_num in self.wallet_states:
-                    self.wallet_states[wallet_num]["error"] = error_msg
-                    self.wallet_states[wallet_num]["status"] = "failed"
-                    self.save_wallet_states()
+                self.log(wallet_num, f"❌ Wallet {wallet_num}: {error_msg}", level=logging.ERROR)
+                retry_after = rate_limited[-1] if rate_limited else None
+                if not rate_limited:
+                    self.rate_controller.on_rate_limited()
+                raise RateLimited(error_msg, retry_after=retry_after) from e
             else:
-                print(f"❌ Wallet {wallet_num}: Error connecting to mining site - {error_message}")
+                self.log(wallet_num, f"❌ Wallet {wallet_num}: Error connecting to mining site - {error_message}", exc_info=True, level=logging.ERROR)
                 # Lưu lỗi vào state
                 if wallet_num in self.wallet_states:
-                    self.wallet_states[wallet_num]["error"] = error_message[:100]  # Giới hạn độ dài
-                    self.wallet_states[wallet_num]["status"] = "failed"
-                    self.save_wallet_states()
-            
-            import traceback
-            traceback.print_exc()
+                    self.wallet_states[wallet_num].error = error_message[:100]  # Giới hạn độ dài
+                    self.wallet_states[wallet_num].status = "failed"
+                    self.save_wallet_states(wallet_num)
             return False
+        finally:
+            popups.close()
+            # Listener chỉ cho lần kết nối này - soft restart trên cùng tab không cộng dồn listener
+            if on_response is not None:
+                mining_page.remove_listener("response", on_response)
+    
+    def record_wallet_result(self, wallet_num, result):
+        """Cập nhật trạng thái ví sau khi process_wallet kết thúc"""
+        if isinstance(result, RateLimited):
+            attempts = self.rate_limit_retries.get(wallet_num, 0) + 1
+            self.rate_limit_retries[wallet_num] = attempts
+            if attempts <= self.max_rate_limit_retries:
+                # Tự xếp hàng lại sau thời gian server yêu cầu thay vì để failed
+                # (lần chạy lại tiếp tục từ checkpoint, không tạo lại ví)
+                delay = result.retry_after if result.retry_after is not None else self.rate_controller.default_retry_after
+                self.set_wallet_state(
+                    wallet_num, "queued",
+                    error=f"429 Too many requests - retry {attempts}/{self.max_rate_limit_retries} sau {delay:.0f}s")
+                self.scheduler.submit_later(wallet_num, delay)
+                self.log(wallet_num, f"⏳ Wallet {wallet_num}: Re-queued in {delay:.0f}s (429 retry {attempts}/{self.max_rate_limit_retries})", level=logging.WARNING)
+                self.save_wallet_states(wallet_num)
+                return
+        
+        if isinstance(result, Exception):
+            self.set_wallet_state(wallet_num, "failed", error=str(result))
+        elif result is not None and self.step_done(wallet_num, "session_started"):
+            self.set_wallet_state(wallet_num, "running", context=result)
+            self.rate_limit_retries.pop(wallet_num, None)
+            self.rate_controller.on_success()
+        elif result is not None:
+            # Browser vẫn mở nhưng chưa tới Start session - giữ context để xem/dừng, restart sẽ resume
+            error = self.wallet_error(wallet_num) or f"Dừng sau bước {self.wallet_step(wallet_num)}"
+            self.set_wallet_state(wallet_num, "failed", context=result, error=error)
+        else:
+            error = self.wallet_error(wallet_num) or "Unknown error"
+            self.set_wallet_state(wallet_num, "failed", error=error)
+        
+        # Lưu trạng thái ngay khi mỗi ví xong (chỉ dòng của ví này)
+        self.save_wallet_states(wallet_num)
     
-    async def run(self):
-        """Chạy bot với N wallets - giới hạn 5 concurrent để tránh timeout"""
+    def resumable_wallets(self):
+        """Ví đã tạo xong ở lần chạy trước và còn profile Chromium - có thể mở lại thay vì tạo mới
+
+        Ví bị dừng chủ động (stopped) được giữ nguyên.
+        """
+        self.load_wallet_states()
+        return [
+            wallet_num for wallet_num, state in self.wallet_states.items()
+            if state.status != "stopped"
+            and self.step_done(wallet_num, "wallet_created")
+            and (self.chrome_data_dir / f"Wallet_{wallet_num}").exists()
+        ]
+    
+    async def run_batch(self, playwright, wallet_nums, ramp_start=None):
+        """Tạo + kết nối các ví qua sliding window - tối đa `concurrency` ví cùng lúc
+
+        ramp_start: bắt đầu với số slot này, AdaptiveRateController tăng dần lên concurrency khi ví thành công;
+        hết đợt thì trả lại concurrency cấu hình để đợt sau (ví mới, restart) không thừa hưởng mức ramp.
+        """
+        wallet_nums = list(wallet_nums)
+        configured = self.scheduler.concurrency
+        rate_limits = self.rate_controller.rate_limited_count
+        if ramp_start:
+            self.scheduler.set_concurrency(min(ramp_start, configured))
+        
+        try:
+            # Ghi mnemonic của mọi ví xuống đĩa trước khi mở browser nào
+            if self.wallet_mode == "restore":
+                self.pregenerate_mnemonics(wallet_nums)
+            
+            # Ví mới bắt đầu ngay khi một slot trống, cách nhau start_spacing giây để tránh 429
+            log_event(f"🚀 Starting {len(wallet_nums)} wallets "
+                  f"(concurrency {self.scheduler.concurrency}, spacing {self.scheduler.start_spacing}s)")
+            self.scheduler.submit_many(wallet_nums)
+            await self.scheduler.run(
+                lambda wallet_num: self.process_wallet_timed(wallet_num, playwright),
+                on_done=self.record_wallet_result,
+            )
+        finally:
+            # 429 trong đợt thì để AIMD tự tăng lại, không xóa backoff
+            if ramp_start and self.rate_controller.rate_limited_count == rate_limits:
+                self.scheduler.set_concurrency(max(self.scheduler.concurrency, configured))
+        log_event(f"✅ All wallets processed - {self.scheduler.summary()}")
+        self.tracer.report()
+        if self.tracer.path:
+            print(f"📝 Step trace: {self.tracer.path}\n")
+    
+    async def run(self, resume_wallets=()):
+        """Chạy bot: mở lại các ví resume_wallets (nếu có), tạo num_wallets ví mới rồi mở dashboard"""
+        self.start_logging()
+        if self.profiler:
+            self.profiler.start()
+        if self.cpu_allocator:
+            # Trước khi khởi động Playwright để driver cũng chạy trên core của bot
+            self.cpu_allocator.pin_orchestrator()
         async with async_playwright() as playwright:
             self.playwright_instance = playwright
             
-            # Chạy từng batch 5 wallets để tránh quá tải
-            batch_size = 5
+            if self.use_profile_template:
+                await self.prepare_profile_template(playwright)
             
-            for batch_start in range(0, self.num_wallets, batch_size):
-                batch_end = min(batch_start + batch_size, self.num_wallets)
-                batch_wallets = range(batch_start + 1, batch_end + 1)
-                
-                print(f"\n🚀 Starting batch: Wallets {batch_start + 1} to {batch_end}")
-                
-                # Delay giữa các batch để tránh 429
-                if batch_start > 0:
-                    delay = 10
-                    print(f"⏳ Waiting {delay}s before next batch to avoid rate limiting...")
-                    await asyncio.sleep(delay)
-                
-                tasks = []
-                for wallet_num in batch_wallets:
-                    task = self.process_wallet(wallet_num, playwright)
-                    tasks.append(task)
-                
-                # Chạy batch này
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                
-                # Cập nhật trạng thái
-                for i, wallet_num in enumerate(batch_wallets):
-                    result = results[i]
-                    if isinstance(result, Exception):
-                        self.wallet_states[wallet_num] = {
-                            "status": "failed",
-                            "context": None,
-                            "start_time": datetime.now(),
-                            "error": str(result)
-                        }
-                    elif result is not None:
-                        self.wallet_states[wallet_num] = {
-                            "status": "running",
-                            "context": result,
-                            "start_time": datetime.now(),
-                            "error": None
-                        }
-                    else:
-                        self.wallet_states[wallet_num] = {
-                            "status": "failed",
-                            "context": None,
-                            "start_time": datetime.now(),
-                            "error": "Unknown error"
-                        }
+            # Theo dõi ví ngay khi ví đầu tiên bắt đầu mining, chạy nền cả lúc đang ở menu
+            self.session_monitor.start()
+            if self.cpu_allocator:
+                self.cpu_allocator.start(self.resources)
+            try:
+                if self.metrics_server:
+                    await self.metrics_server.start()
+                if resume_wallets:
+                    # Mở lại profile cũ -> mở khóa Lace -> vào lại site mining (không tạo ví mới)
+                    log_event(f"🔁 Resuming {len(resume_wallets)} existing wallets (ramp từ {self.resume_ramp_start} slot)")
+                    for wallet_num in resume_wallets:
+                        self.set_wallet_state(wallet_num, "queued")
+                    self.save_wallet_states(*resume_wallets)
+                    await self.run_batch(playwright, resume_wallets, ramp_start=self.resume_ramp_start)
                 
-                # Lưu trạng thái sau mỗi batch
-                self.save_wallet_states()
+                if self.num_wallets > 0:
+                    # Ví mới đánh số tiếp sau các ví đã có
+                    first = max(self.wallet_states, default=0) + 1
+                    await self.run_batch(playwright, range(first, first + self.num_wallets))
                 
-                print(f"✅ Batch {batch_start + 1}-{batch_end} completed\n")
-            
-            # Hiển thị menu quản lý
-            await self.show_management_menu()
+                # Hiển thị menu quản lý
+                await self.show_management_menu()
+            finally:
+                if self.metrics_server:
+                    await self.metrics_server.stop()
+                await self.session_monitor.stop()
+                if self.cpu_allocator:
+                    await self.cpu_allocator.stop()
+                self.tracer.close()
+                self.close_state_store()
+                if self.trace_sampler:
+                    log_event(f"🎞️ Playwright trace: giữ {self.trace_sampler.kept}, bỏ {self.trace_sampler.discarded}")
+                if self.profiler:
+                    self.profiler.stop()
+                self.stop_logging()
     
     async def show_management_menu(self):
         """Hiển thị menu quản lý ví"""
@@ -699,37 +2950,53 @@ class PlaywrightLaceBot:
             print("="*60)
             
             # Hiển thị trạng thái tất cả ví
+            await self.refresh_resources()
             self.display_wallet_status()
             
             print("\n" + "-"*60)
             print("🎮 MENU:")
             print("  1. ⏸️  Dừng ví (Stop wallets)")
-            print("  2. ▶️  Khởi động lại ví (Restart wallets)")
-            print("  3. 🔍 Xem chi tiết ví (View wallet details)")
-            print("  4. 🔄 Làm mới trạng thái (Refresh status)")
-            print("  5. 🚪 Thoát (Exit)")
+            print("  2. ▶️  Khởi động lại ví - mở lại browser (Restart wallets)")
+            print("  3. ♻️  Chạy lại phiên mining, giữ browser (Soft restart)")
+            print("  4. 🔍 Xem chi tiết ví (View wallet details)")
+            print("  5. 🔄 Làm mới trạng thái (Refresh status)")
+            print("  6. 📈 Xuất lịch sử mining ra CSV (Export throughput)")
+            print("  7. 🚪 Thoát (Exit)")
+            print("  n/p. ⏭️  Trang sau/trước | f. 🔎 Lọc theo trạng thái hoặc lỗi")
             print("-"*60)
             
-            choice = input("\nChọn hành động (1-5): ").strip()
+            choice = (await ainput("\nChọn hành động (1-7, n, p, f): ")).strip().lower()
             
             if choice == "1":
                 await self.stop_wallets_interactive()
             elif choice == "2":
                 await self.restart_wallets_interactive()
             elif choice == "3":
-                self.view_wallet_details()
+                await self.soft_restart_wallets_interactive()
             elif choice == "4":
-                continue  # Refresh bằng cách loop lại
+                await self.view_wallet_details()
             elif choice == "5":
+                continue  # Refresh bằng cách loop lại
+            elif choice == "6":
+                path = self.wallets_dir / f"mining_health_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+                self.session_monitor.export_csv(path)
+                print(f"✅ Đã xuất lịch sử mining: {path}")
+            elif choice == "7":
                 print("\n👋 Đang đóng tất cả ví...")
                 await self.stop_all_wallets()
                 break
+            elif choice == "n":
+                self.dashboard_page += 1
+            elif choice == "p":
+                self.dashboard_page = max(0, self.dashboard_page - 1)
+            elif choice == "f":
+                await self.set_dashboard_filter()
             else:
                 print("❌ Lựa chọn không hợp lệ!")
     
-    def view_wallet_details(self):
+    async def view_wallet_details(self):
         """Xem chi tiết thông tin ví"""
-        wallet_id = input("\nNhập ID ví cần xem chi tiết: ").strip()
+        wallet_id = (await ainput("\nNhập ID ví cần xem chi tiết: ")).strip()
         
         try:
             wallet_num = int(wallet_id)
@@ -774,227 +3041,540 @@ class PlaywrightLaceBot:
         # Hiển thị trạng thái
         state = self.wallet_states[wallet_num]
         print("\n" + "-"*60)
-        print(f"📊 Trạng thái: {state['status'].upper()}")
-        print(f"⏰ Thời gian bắt đầu: {state['start_time'].strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"📊 Trạng thái: {state.status.upper()}")
+        print(f"⏰ Thời gian bắt đầu: {state.start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+        if state.step:
+            print(f"🪜 Bước đã xong: {state.step}")
+        
+        if state.error:
+            print(f"❌ Lỗi: {state.error}")
         
-        if state.get('error'):
-            print(f"❌ Lỗi: {state['error']}")
+        if wallet_num in self.request_filters:
+            print(f"🚫 Đã chặn: {self.request_filters[wallet_num].summary()}")
+        
+        usage = self.resources.usage.get(wallet_num)
+        if usage and usage["pids"]:
+            cpu_line = f"🧮 CPU: {usage['cpu']:.0f}% ({len(usage['pids'])} process)"
+            allocation = self.cpu_allocator.describe(wallet_num) if self.cpu_allocator else None
+            if allocation:
+                cpu_line += f" - {allocation}"
+            health = self.session_monitor.health.get(wallet_num)
+            if health and health["rate"] and usage["cpu"]:
+                # Hiệu suất: solution/phút trên mỗi core đang dùng
+                cpu_line += f" | {health['rate'] / (usage['cpu'] / 100):.1f} solution/phút/core"
+            print(cpu_line)
         
         print("="*60)
-        input("\nNhấn Enter để quay lại menu...")
+        await ainput("\nNhấn Enter để quay lại menu...")
+    
+    def display_scaling(self):
+        """Throughput theo số ví mining: thêm ví còn tăng tổng solution/phút hay chỉ thêm tranh chấp"""
+        rows = self.session_monitor.scaling()
+        if len(rows) < 2:
+            return
+        cells = []
+        for count, rate, per_wallet, marginal in rows[-4:]:
+            cell = f"{count} ví {rate:.1f}/phút"
+            if marginal is not None:
+                cell += f" ({marginal:+.1f}/ví thêm)"
+            cells.append(cell)
+        print(f"   📐 Scaling: {' → '.join(cells)}")
+        count, rate, per_wallet, marginal = rows[-1]
+        previous_per_wallet = rows[-2][2]
+        if marginal is not None and marginal < 0.5 * previous_per_wallet:
+            print(f"   ⚠️ Thêm ví gần như không tăng throughput ({marginal:+.1f}/ví thêm, "
+                  f"trung bình {previous_per_wallet:.1f}/ví) - CPU đang tranh chấp")
+    
+    async def set_dashboard_filter(self):
+        """Chọn bộ lọc dashboard: trạng thái (running, failed, ...) và/hoặc nhóm lỗi (429, timeout, ...)"""
+        print(f"\n  Trạng thái: {', '.join(WALLET_STATUSES)}")
+        print(f"  Nhóm lỗi: {', '.join(ERROR_CLASSES)}")
+        text = (await ainput("Nhập bộ lọc (vd: failed 429, Enter = bỏ lọc): ")).strip().lower()
+        status = error_class = None
+        for token in text.split():
+            if token in WALLET_STATUSES:
+                status = token
+            elif token in ERROR_CLASSES:
+                error_class = token
+            else:
+                print(f"❌ Bộ lọc không hợp lệ: {token}")
+                return
+        self.dashboard_status, self.dashboard_error = status, error_class
+        self.dashboard_page = 0
     
     def display_wallet_status(self):
-        """Hiển thị trạng thái tất cả ví"""
+        """Hiển thị thống kê + một trang ví theo bộ lọc hiện tại
+
+        Thống kê đọc từ bộ đếm của WalletRegistry, bảng chỉ duyệt các ví trong trang
+        nên chi phí refresh không tăng theo số ví.
+        """
         if not self.wallet_states:
             print("  Chưa có ví nào được tạo")
             return
         
         # Thống kê
-        total = len(self.wallet_states)
-        running = sum(1 for s in self.wallet_states.values() if s["status"] == "running")
-        stopped = sum(1 for s in self.wallet_states.values() if s["status"] == "stopped")
-        failed = sum(1 for s in self.wallet_states.values() if s["status"] == "failed")
+        registry = self.wallet_states
+        total = len(registry)
+        running = registry.count("running")
+        stopped = registry.count("stopped")
+        failed = registry.count("failed")
+        queued = registry.count("queued")
         
         # Đếm số lỗi 429
-        error_429 = sum(1 for s in self.wallet_states.values() 
-                       if s.get("error") and "429" in s.get("error", ""))
+        error_429 = registry.error_counts["429"]
         
-        print(f"\n📈 THỐNG KÊ: Tổng: {total} | 🟢 Đang chạy: {running} | 🟡 Đã dừng: {stopped} | 🔴 Lỗi: {failed}")
+        print(f"\n📈 THỐNG KÊ: Tổng: {total} | 🟢 Đang chạy: {running} | 🟡 Đã dừng: {stopped} | 🔴 Lỗi: {failed} | ⏳ Chờ retry: {queued}")
         print(f"   Tỷ lệ thành công: {running}/{total} ({running*100//total if total > 0 else 0}%)")
+        errors = ", ".join(f"{name} {n}" for name, n in registry.error_counts.most_common() if n)
+        if errors:
+            print(f"   🧾 Nhóm lỗi: {errors}")
         
         if error_429 > 0:
             print(f"   ⚠️ Cảnh báo: {error_429} ví bị lỗi 429 (Too many requests)")
+            print(f"   🐢 Rate limit: concurrency {self.scheduler.concurrency}, spacing {self.scheduler.start_spacing:.1f}s")
         
-        print(f"\n{'ID':<8} {'Tên':<15} {'Trạng thái':<12} {'Thời gian':<20} {'Ghi chú':<30}")
-        print("-"*90)
+        # RAM/CPU thật của Chromium - số đo đã lấy sẵn ngoài event loop (refresh_resources)
+        usage = self.resources.usage
+        if self.resources.available:
+            budget = f" / {self.resources.memory_budget / 2**30:.1f} GB" if self.resources.memory_budget else ""
+            print(f"   🧠 Browser RAM: {self.resources.total_rss() / 2**30:.2f} GB{budget} | "
+                  f"CPU: {sum(u['cpu'] for u in usage.values()):.0f}% | "
+                  f"Load/core: {self.resources.load_per_core():.2f}")
         
-        for wallet_num in sorted(self.wallet_states.keys()):
-            state = self.wallet_states[wallet_num]
-            status = state["status"]
+        if self.session_monitor.health:
+            health = self.session_monitor.last_summary()
+            print(f"   ⛏️  Mining: ✅ {health['ok']} ổn định | 🐌 {health['stalled']} đứng yên | "
+                  f"⏹️ {health['stopped']} mất phiên | 💀 {health['dead']} chết | "
+                  f"{self.session_monitor.fleet_rate():.1f} solution/phút")
+            self.display_scaling()
+        
+        if self.cpu_allocator and self.cpu_allocator.assigned:
+            allocator = self.cpu_allocator
+            print(f"   🧩 CPU: bot core {sorted(allocator.reserved) or '-'} | {len(allocator.assigned)} ví trên "
+                  f"{len(allocator.pool)} core ({allocator.wallets_per_core():.1f} ví/core), nice {allocator.nice}")
+        
+        if self.request_filters:
+            blocked = sum(f.requests for f in self.request_filters.values())
+            blocked_bytes = sum(f.bytes for f in self.request_filters.values())
+            print(f"   🚫 Đã chặn: {blocked} requests, ≥ {blocked_bytes / 2**20:.1f} MB")
+        
+        records, matched = registry.page(self.dashboard_status, self.dashboard_error,
+                                         self.dashboard_page, self.dashboard_page_size)
+        pages = max(1, math.ceil(matched / self.dashboard_page_size))
+        if self.dashboard_page >= pages:
+            self.dashboard_page = pages - 1
+            records, matched = registry.page(self.dashboard_status, self.dashboard_error,
+                                             self.dashboard_page, self.dashboard_page_size)
+        filters = " ".join(f for f in (self.dashboard_status, self.dashboard_error) if f) or "tất cả"
+        print(f"\n🔎 Lọc: {filters} | {matched} ví | Trang {self.dashboard_page + 1}/{pages}")
+        
+        print(f"\n{'ID':<8} {'Tên':<15} {'Trạng thái':<12} {'Thời gian':<20} {'RAM':<10} {'Ghi chú':<30}")
+        print("-"*100)
+        
+        now = datetime.now()
+        for state in records:
+            wallet_num = state.wallet_num
+            status = state.status
             
             # Icon theo trạng thái
             if status == "running":
                 icon = "🟢"
             elif status == "stopped":
                 icon = "🟡"
+            elif status == "queued":
+                icon = "⏳"
             else:
                 icon = "🔴"
             
             # Tính thời gian chạy
-            start_time = state["start_time"]
-            elapsed = datetime.now() - start_time
+            elapsed = now - state.start_time
             time_str = f"{int(elapsed.total_seconds() / 60)}m {int(elapsed.total_seconds() % 60)}s"
             
             # Ghi chú - highlight lỗi 429
-            error = state.get("error", "")
-            if error:
-                if "429" in error:
+            if state.error:
+                if state.error_class == "429":
                     note = "⚠️ 429 Too many requests"[:30]
                 else:
-                    note = error[:30]
+                    note = state.error[:30]
             else:
                 note = "OK"
+            health = self.session_monitor.health.get(wallet_num)
+            if status == "running" and health:
+                if health["health"] != "ok":
+                    note = f"⚠️ {health['health']}: {health['error'] or ''}"[:30]
+                elif health["rate"] is not None:
+                    note = f"⛏️ {health['rate']:.1f}/phút"
+            
+            rss = usage.get(wallet_num, {}).get("rss", 0)
+            ram_str = f"{rss / 2**20:.0f} MB" if rss else "-"
             
-            print(f"{wallet_num:<8} {f'Wallet {wallet_num}':<15} {icon} {status:<9} {time_str:<20} {note:<30}")
+            print(f"{wallet_num:<8} {f'Wallet {wallet_num}':<15} {icon} {status:<9} {time_str:<20} {ram_str:<10} {note:<30}")
     
-    async def stop_wallets_interactive(self):
-        """Cho phép chọn và dừng các ví"""
-        wallet_ids = input("\nNhập ID ví cần dừng (cách nhau bởi dấu phấy, vd: 1,3,5 hoặc 'all'): ").strip()
+    async def select_wallets(self, action):
+        """Hỏi danh sách ID ví ('all' = tất cả), trả về các ID hợp lệ hoặc None nếu nhập sai"""
+        wallet_ids = (await ainput(f"\nNhập ID ví cần {action} (cách nhau bởi dấu phấy, vd: 1,3,5 hoặc 'all'): ")).strip()
         
         if wallet_ids.lower() == "all":
-            selected = list(self.wallet_states.keys())
-        else:
-            try:
-                selected = [int(x.strip()) for x in wallet_ids.split(",")]
-            except ValueError:
-                print("❌ Định dạng không hợp lệ!")
-                return
+            return list(self.wallet_states.keys())
+        try:
+            selected = [int(x.strip()) for x in wallet_ids.split(",")]
+        except ValueError:
+            print("❌ Định dạng không hợp lệ!")
+            return None
         
         for wallet_num in selected:
             if wallet_num not in self.wallet_states:
                 print(f"❌ Wallet {wallet_num} không tồn tại")
-                continue
-            
+        return [wallet_num for wallet_num in selected if wallet_num in self.wallet_states]
+    
+    async def close_wallets(self, wallet_nums, status=None):
+        """Đóng browser của nhiều ví song song (tối đa close_concurrency cùng lúc, mỗi ví close_timeout giây)
+
+        status: trạng thái ghi cho ví sau khi đóng (None = giữ nguyên, vd khi thoát để lần sau resume).
+        """
+        wallet_nums = list(wallet_nums)
+        closer = WalletScheduler(concurrency=self.close_concurrency, start_spacing=0, name="Close")
+        
+        async def close_one(wallet_num):
             state = self.wallet_states[wallet_num]
-            if state["status"] == "stopped":
+            # Ngừng theo dõi trước để SessionMonitor không báo dead nhầm
+            self.session_monitor.unwatch(wallet_num)
+            context, state.context = state.context, None
+            if context:
+                await asyncio.wait_for(context.close(), timeout=self.close_timeout)
+            return context is not None
+        
+        def on_closed(wallet_num, result):
+            if isinstance(result, asyncio.TimeoutError):
+                log_event(f"⚠️ Wallet {wallet_num}: Browser không đóng sau {self.close_timeout}s, bỏ qua", wallet=wallet_num, level=logging.WARNING)
+            elif isinstance(result, Exception):
+                log_event(f"⚠️ Lỗi khi đóng Wallet {wallet_num}: {result}", wallet=wallet_num, level=logging.WARNING)
+            elif result:
+                log_event(f"✅ Đã đóng Wallet {wallet_num}", wallet=wallet_num, summary=True)
+            if status:
+                self.wallet_states[wallet_num].status = status
+        
+        closer.submit_many(wallet_nums)
+        await closer.run(close_one, on_done=on_closed)
+        if status:
+            self.save_wallet_states(*wallet_nums)
+    
+    async def stop_wallets_interactive(self):
+        """Cho phép chọn và dừng các ví"""
+        selected = await self.select_wallets("dừng")
+        if not selected:
+            return
+        
+        for wallet_num in selected:
+            if self.wallet_states[wallet_num].status == "stopped":
                 print(f"⚠️ Wallet {wallet_num} đã dừng rồi")
-                continue
-            
-            # Đóng browser context
-            if state["context"]:
-                try:
-                    await state["context"].close()
-                    print(f"✅ Đã dừng Wallet {wallet_num}")
-                except Exception as e:
-                    print(f"❌ Lỗi khi dừng Wallet {wallet_num}: {e}")
-            
-            # Cập nhật trạng thái
-            state["status"] = "stopped"
-            state["context"] = None
+        to_stop = [wallet_num for wallet_num in selected if self.wallet_states[wallet_num].status != "stopped"]
         
-        # Lưu trạng thái
-        self.save_wallet_states()
+        print(f"\n⏸️  Đang dừng {len(to_stop)} ví...")
+        await self.close_wallets(to_stop, status="stopped")
     
     async def restart_wallets_interactive(self):
         """Cho phép chọn và khởi động lại các ví"""
-        wallet_ids = input("\nNhập ID ví cần khởi động lại (cách nhau bởi dấu phấy, vd: 1,3,5 hoặc 'all'): ").strip()
-        
-        if wallet_ids.lower() == "all":
-            selected = list(self.wallet_states.keys())
-        else:
-            try:
-                selected = [int(x.strip()) for x in wallet_ids.split(",")]
-            except ValueError:
-                print("❌ Định dạng không hợp lệ!")
-                return
+        selected = await self.select_wallets("khởi động lại")
+        if not selected:
+            return
         
         print(f"\n🔄 Đang khởi động lại {len(selected)} ví...")
         
-        tasks = []
+        # Đóng ví cũ song song trước khi chạy lại
+        await self.close_wallets(selected)
         for wallet_num in selected:
-            if wallet_num not in self.wallet_states:
-                print(f"❌ Wallet {wallet_num} không tồn tại")
-                continue
-            
-            # Dừng ví cũ nếu đang chạy
-            state = self.wallet_states[wallet_num]
-            if state["context"]:
-                try:
-                    await state["context"].close()
-                except:
-                    pass
-            
-            # Khởi động lại
-            task = self.process_wallet(wallet_num, self.playwright_instance)
-            tasks.append((wallet_num, task))
+            self.set_wallet_state(wallet_num, "queued")
+        self.save_wallet_states(*selected)
         
-        # Chạy song song
-        for wallet_num, task in tasks:
-            try:
-                context = await task
-                if context:
-                    self.wallet_states[wallet_num] = {
-                        "status": "running",
-                        "context": context,
-                        "start_time": datetime.now(),
-                        "error": None
-                    }
-                    print(f"✅ Đã khởi động lại Wallet {wallet_num}")
+        # Chạy lại qua cùng scheduler với lần chạy đầu (concurrency, spacing, RAM/CPU, AIMD 429)
+        # - tiếp tục từ bước chưa xong, dùng lại profile + ví cũ
+        self.scheduler.submit_many(selected)
+        await self.scheduler.run(
+            lambda wallet_num: self.process_wallet_timed(wallet_num, self.playwright_instance),
+            on_done=self.record_wallet_result,
+        )
+        
+        restarted = sum(1 for wallet_num in selected if self.wallet_states[wallet_num].status == "running")
+        print(f"✅ Đã khởi động lại {restarted}/{len(selected)} ví - {self.scheduler.summary()}")
+    
+    async def soft_restart_wallet(self, wallet_num):
+        """Chạy lại phiên mining trong browser đang mở: tải lại tab mining rồi Start session
+
+        Giữ nguyên context, profile và ví Lace; chỉ authorize / ký lại nếu site hỏi.
+        Trả về True nếu phiên mining đã chạy lại.
+        """
+        state = self.wallet_states[wallet_num]
+        context = state.context
+        if context is None:
+            raise RuntimeError("Browser không mở - dùng khởi động lại đầy đủ")
+        if not self.step_done(wallet_num, "wallet_created"):
+            raise RuntimeError("Chưa tạo xong ví Lace - dùng khởi động lại đầy đủ")
+        
+        # Tab mining đang theo dõi, không có thì tìm theo URL, cuối cùng mới mở tab mới
+        # (tab đã crash không dùng lại được - luôn mở tab mới)
+        mining_page = self.session_monitor.pages.get(wallet_num)
+        if state.error == "Page crashed":
+            mining_page = None
+        elif mining_page is None or mining_page.is_closed():
+            mining_page = next((p for p in context.pages
+                                if self.mining_site_host in p.url and not p.is_closed()), None)
+        self.session_monitor.unwatch(wallet_num)
+        
+        # Lùi checkpoint về trước Start session để kết quả phản ánh lần chạy lại này
+        if self.step_done(wallet_num, "session_started"):
+            self.mark_step(wallet_num, "message_signed", reset=True)
+        self.set_wallet_state(wallet_num, "starting", context=context)
+        # connect_to_mining_site chỉ cần một page bất kỳ của context (mining_page=None: mở tab mới)
+        page = mining_page or (context.pages[0] if context.pages else await context.new_page())
+        return await asyncio.wait_for(
+            self.connect_to_mining_site(page, wallet_num, mining_page=mining_page), timeout=self.wallet_timeout)
+    
+    async def soft_restart_wallets(self, wallet_nums):
+        """Soft restart nhiều ví song song, cùng giới hạn concurrency/spacing với scheduler chính"""
+        wallet_nums = list(wallet_nums)
+        restarter = WalletScheduler(concurrency=self.scheduler.concurrency, start_spacing=self.scheduler.start_spacing,
+                                    name="Soft restart")
+        
+        def on_done(wallet_num, result):
+            state = self.wallet_states[wallet_num]
+            if result is True:
+                self.set_wallet_state(wallet_num, "running", context=state.context)
+                log_event(f"♻️  Wallet {wallet_num}: Mining session restarted", wallet=wallet_num, summary=True)
+            else:
+                if isinstance(result, RateLimited):
+                    # Không xếp hàng lại qua scheduler chính (sẽ launch browser thứ hai trên cùng profile)
+                    error = "429 Too many requests - thử soft restart lại sau"
+                elif isinstance(result, asyncio.TimeoutError):
+                    error = f"Soft restart timeout sau {self.wallet_timeout}s"
+                elif isinstance(result, Exception):
+                    error = str(result) or type(result).__name__
                 else:
-                    self.wallet_states[wallet_num]["status"] = "failed"
-                    print(f"❌ Khởi động lại Wallet {wallet_num} thất bại")
-            except Exception as e:
-                self.wallet_states[wallet_num]["status"] = "failed"
-                self.wallet_states[wallet_num]["error"] = str(e)
-                print(f"❌ Lỗi khi khởi động lại Wallet {wallet_num}: {e}")
+                    error = self.wallet_error(wallet_num) or f"Dừng sau bước {self.wallet_step(wallet_num)}"
+                self.set_wallet_state(wallet_num, "failed", context=state.context, error=error[:100])
+                log_event(f"❌ Wallet {wallet_num}: Soft restart failed - {error}", wallet=wallet_num, level=logging.ERROR)
+            self.save_wallet_states(wallet_num)
+        
+        restarter.submit_many(wallet_nums)
+        await restarter.run(self.soft_restart_wallet, on_done=on_done)
+        return sum(1 for wallet_num in wallet_nums if self.wallet_states[wallet_num].status == "running")
+    
+    async def soft_restart_wallets_interactive(self):
+        """Chọn ví để chạy lại phiên mining mà không đóng browser"""
+        selected = await self.select_wallets("soft restart")
+        if not selected:
+            return
+        
+        to_restart = []
+        for wallet_num in selected:
+            if self.wallet_states[wallet_num].context is None:
+                print(f"⚠️ Wallet {wallet_num}: Browser không mở - dùng khởi động lại đầy đủ (2)")
+            elif not self.step_done(wallet_num, "wallet_created"):
+                print(f"⚠️ Wallet {wallet_num}: Chưa tạo xong ví Lace - dùng khởi động lại đầy đủ (2)")
+            else:
+                to_restart.append(wallet_num)
+        if not to_restart:
+            return
         
-        # Lưu trạng thái
-        self.save_wallet_states()
+        print(f"\n♻️  Đang chạy lại phiên mining của {len(to_restart)} ví (giữ browser)...")
+        restarted = await self.soft_restart_wallets(to_restart)
+        print(f"✅ Đã chạy lại {restarted}/{len(to_restart)} phiên mining")
     
     async def stop_all_wallets(self):
-        """Dừng tất cả ví"""
-        for wallet_num, state in self.wallet_states.items():
-            if state["context"]:
-                try:
-                    await state["context"].close()
-                    print(f"✅ Đã đóng Wallet {wallet_num}")
-                except Exception as e:
-                    print(f"⚠️ Lỗi khi đóng Wallet {wallet_num}: {e}")
+        """Dừng tất cả ví (giữ nguyên trạng thái đã lưu)"""
+        await self.close_wallets([wallet_num for wallet_num, state in self.wallet_states.items() if state.context])
     
-    async def process_wallet(self, wallet_num, playwright):
-        """Xử lý 1 wallet hoàn chỉnh"""
+    async def process_wallet_timed(self, wallet_num, playwright):
+        """process_wallet (resume) với giới hạn wallet_timeout giây cho mỗi ví"""
         try:
-            # Launch browser
-            context, page, mnemonic = await self.launch_browser_with_wallet(wallet_num, playwright)
-            
-            # Setup Lace wallet
-            success = await self.setup_lace_wallet(page, mnemonic, wallet_num, self.password)
+            return await asyncio.wait_for(self.process_wallet(wallet_num, playwright, resume=True),
+                                          timeout=self.wallet_timeout)
+        except asyncio.TimeoutError:
+            self.log(wallet_num, f"⏰ Wallet {wallet_num}: Timeout sau {self.wallet_timeout}s", level=logging.WARNING)
+            raise TimeoutError(f"Timeout sau {self.wallet_timeout}s") from None
+    
+    async def process_wallet(self, wallet_num, playwright, resume=False):
+        """Xử lý 1 wallet hoàn chỉnh
+
+        resume=True: tiếp tục từ checkpoint - profile đã có thì mở lại, ví đã tạo thì chỉ mở khóa.
+        """
+        context = None
+        prefetch = None
+        try:
+            # Launch browser - ví đã tạo xong thì mở lại profile cũ thay vì tạo ví mới
+            # Ví đã tạo không bao giờ được tạo lại khi resume - mnemonic.txt có thể là bản duy nhất của seed phrase
+            reuse_profile = resume and self.step_done(wallet_num, "wallet_created")
+            success = False
+            if reuse_profile:
+                self.log(wallet_num, f"♻️  Wallet {wallet_num}: Resuming after step '{self.wallet_step(wallet_num)}'", summary=True)
+                self.tracer.begin(wallet_num, "browser_launch")
+                context, page, mnemonic = await self.launch_browser_with_wallet(wallet_num, playwright, reuse_profile=True)
+                await self.start_trace(wallet_num, context)
+                prefetch = self.prefetch_mining_site(context, wallet_num)
+                password = self.wallet_password(wallet_num)
+                success = await self.unlock_lace_wallet(page, wallet_num, password)
+                if not success:
+                    # Profile hỏng / mất ví - restore đúng ví cũ từ seed phrase đã lưu, giữ nguyên file
+                    saved_mnemonic = self.read_saved_mnemonic(wallet_num)
+                    if not saved_mnemonic:
+                        raise RuntimeError("Profile mất ví và mnemonic.txt không hợp lệ - không tạo ví mới")
+                    self.log(wallet_num, f"♻️  Wallet {wallet_num}: Restoring saved recovery phrase", level=logging.WARNING)
+                    success = await self.restore_lace_wallet(page, saved_mnemonic, wallet_num, password)
+                    if not success:
+                        raise RuntimeError("Restore ví từ mnemonic đã lưu thất bại")
+            else:
+                self.tracer.begin(wallet_num, "browser_launch")
+                context, page, mnemonic = await self.launch_browser_with_wallet(wallet_num, playwright)
+                await self.start_trace(wallet_num, context)
+                # Site mining tải song song với các màn onboarding của Lace
+                prefetch = self.prefetch_mining_site(context, wallet_num)
+                # Profile mới hoàn toàn - mọi bước sau phải làm lại
+                self.mark_step(wallet_num, "profile_ready", reset=True)
+                
+                # Setup Lace wallet
+                if self.wallet_mode == "restore":
+                    success = await self.restore_lace_wallet(page, mnemonic, wallet_num, self.password)
+                else:
+                    success = await self.setup_lace_wallet(page, mnemonic, wallet_num, self.password)
+                if success:
+                    self.mark_step(wallet_num, "wallet_created")
             
             if success:
-                # Connect to mining site and register
-                await self.connect_to_mining_site(page, wallet_num)
+                # Lùi checkpoint về trước Start session - ví chỉ "running" nếu lần kết nối này Start session được
+                if self.step_done(wallet_num, "session_started"):
+                    self.mark_step(wallet_num, "message_signed", reset=True)
+                # Connect to mining site and register - chỉ sau khi ví đã tạo / mở khóa xong
+                # Từ đây tab prefetch thuộc về connect_to_mining_site (kể cả khi nó lỗi)
+                pending, prefetch = prefetch, None
+                await self.connect_to_mining_site(page, wallet_num, prefetch=pending)
+            
+            if wallet_num in self.request_filters:
+                self.log(wallet_num, f"🚫 Wallet {wallet_num}: Blocked {self.request_filters[wallet_num].summary()}")
+            
+            # Trace chỉ bao pipeline tạo/kết nối - phiên mining chạy tiếp không bị ghi
+            started = self.step_done(wallet_num, "session_started")
+            await self.finish_trace(wallet_num, failed=not started, reason=self.wallet_step(wallet_num) or "setup")
             
             # Return context để giữ browser mở
             return context
             
+        except asyncio.CancelledError:
+            # Hết wallet_timeout - đóng browser dở dang rồi để hủy tiếp tục
+            self.tracer.fail(wallet_num, "timeout")
+            await self.finish_trace(wallet_num, failed=True, reason="timeout")
+            if context:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+            raise
+        except RateLimited:
+            self.tracer.end(wallet_num)
+            if self.trace_sampler:
+                await self.trace_sampler.discard(wallet_num)
+            # Đóng browser, scheduler chạy lại ví sau Retry-After (tiếp tục từ checkpoint)
+            if context:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+            raise
         except Exception as e:
-            print(f"❌ Wallet {wallet_num}: Fatal error - {e}")
-            import traceback
-            traceback.print_exc()
+            self.tracer.fail(wallet_num, e)
+            self.log(wallet_num, f"❌ Wallet {wallet_num}: Fatal error - {e}", exc_info=True, level=logging.ERROR)
+            await self.finish_trace(wallet_num, failed=True, reason=type(e).__name__)
+            # Không trả context - đóng browser để không bỏ lại Chromium mồ côi
+            if context:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
             return None
+        finally:
+            # Ví dừng trước khi kết nối - không tải site nữa / đóng tab đã tải sẵn
+            await self.discard_prefetch(prefetch)
+
 
+def parse_args(argv=None):
+    """Tùy chọn dòng lệnh -> kwargs của PlaywrightLaceBot (chỉ các tùy chọn được truyền, còn lại giữ mặc định)"""
+    parser = argparse.ArgumentParser(description="Lace wallet auto mining bot", argument_default=argparse.SUPPRESS)
+    parser.add_argument("--concurrency", type=int, help="Số ví xử lý cùng lúc (mặc định 5)")
+    parser.add_argument("--start-spacing", type=float, help="Giãn cách (giây) giữa các lần start ví")
+    parser.add_argument("--launch-profile", choices=list(LAUNCH_PROFILES))
+    parser.add_argument("--wallet-mode", choices=["create", "restore"])
+    parser.add_argument("--profile-template", dest="use_profile_template", action="store_true",
+                        help="Clone profile ví mới từ golden profile")
+    parser.add_argument("--block-resources", action="store_true", help="Chặn ảnh/video/font/analytics")
+    parser.add_argument("--memory-budget-mb", type=int)
+    parser.add_argument("--max-load-per-core", type=float)
+    parser.add_argument("--data-dir", help="Thư mục mnemonic/profile/trạng thái (mặc định wallets/)")
+    parser.add_argument("--mining-site-url", help="Vd http://127.0.0.1:8765 (mock_mining_site.py)")
+    parser.add_argument("--no-prefetch", dest="prefetch_site", action="store_false",
+                        help="Tải site mining sau khi tạo ví xong")
+    parser.add_argument("--metrics-port", type=int, help="Bật endpoint Prometheus /metrics")
+    parser.add_argument("--metrics-host")
+    parser.add_argument("--playwright-trace", action="store_true", help="Giữ Playwright trace của ví lỗi / chậm")
+    parser.add_argument("--trace-slow-after", type=float, help="Ngưỡng chậm (giây) thay cho p95")
+    parser.add_argument("--profiler", choices=["cprofile", "yappi"])
+    parser.add_argument("--cpu-affinity", action="store_true", help="Ghim Chromium từng ví vào core riêng (Linux)")
+    parser.add_argument("--reserved-cores", type=int)
+    parser.add_argument("--cores-per-wallet", type=int)
+    parser.add_argument("--wallet-nice", type=int)
+    parser.add_argument("--dashboard-page-size", type=int)
+    parser.add_argument("--verbose", action="store_true", help="Console hiện log từng bước của mọi ví")
+    return vars(parser.parse_args(argv))
 
-async def main():
+
+async def main(options=None):
     print("="*60)
     print("🤖 LACE WALLET AUTO MINING BOT")
     print("="*60)
     
-    # Nhập số lượng wallets và password
+    bot = PlaywrightLaceBot(**(options or {}))
+    bot.start_logging()
+    # Mọi đường thoát (kể cả nhập sai) đều đóng store và flush log đang chờ trong queue
     try:
-        num_wallets = int(input("\n📊 Số lượng wallets cần tạo: "))
-        if num_wallets <= 0:
-            print("❌ Số lượng wallet phải lớn hơn 0!")
+        # Ví đã tạo ở lần chạy trước (sau reboot / tắt bot) - mở lại thay vì tạo lại từ đầu
+        resume_wallets = bot.resumable_wallets()
+        if resume_wallets:
+            answer = input(f"\n🔁 Tìm thấy {len(resume_wallets)} ví đã tạo - mở lại và tiếp tục mining? (Y/n): ").strip().lower()
+            if answer in ("n", "no"):
+                resume_wallets = []
+        
+        # Nhập số lượng wallets và password
+        min_wallets = 0 if resume_wallets else 1
+        try:
+            num_wallets = int(input("\n📊 Số lượng wallets mới cần tạo: " if resume_wallets else "\n📊 Số lượng wallets cần tạo: "))
+            if num_wallets < min_wallets:
+                print("❌ Số lượng wallet phải lớn hơn 0!" if min_wallets else "❌ Số lượng wallet không được âm!")
+                return
+        except ValueError:
+            print("❌ Vui lòng nhập số hợp lệ!")
             return
-    except ValueError:
-        print("❌ Vui lòng nhập số hợp lệ!")
-        return
-    
-    password = input("🔒 Mật khẩu cho tất cả wallets: ")
-    if not password:
-        print("❌ Mật khẩu không được để trống!")
-        return
-    
-    print(f"\n🚀 Bắt đầu tạo {num_wallets} ví...")
-    print(f"🔒 Mật khẩu: {'*' * len(password)}")
-    print("-"*60)
-    
-    bot = PlaywrightLaceBot(num_wallets=num_wallets, password=password)
-    await bot.run()
+        
+        password = input("🔒 Mật khẩu cho tất cả wallets: ")
+        if not password:
+            print("❌ Mật khẩu không được để trống!")
+            return
+        
+        if resume_wallets:
+            print(f"\n🔁 Mở lại {len(resume_wallets)} ví (mật khẩu lấy từ wallet_info.json của từng ví)")
+        print(f"\n🚀 Bắt đầu tạo {num_wallets} ví...")
+        print(f"🔒 Mật khẩu: {'*' * len(password)}")
+        print("-"*60)
+        
+        bot.num_wallets = num_wallets
+        bot.password = password
+        await bot.run(resume_wallets=resume_wallets)
+    finally:
+        bot.close_state_store()
+        bot.stop_logging()
 
 
 if __name__ == "__main__":
+    options = parse_args()
     try:
-        asyncio.run(main())
+        asyncio.run(main(options))
     except KeyboardInterrupt:
         print("\n\n👋 Bot đã dừng bởi người dùng")
     except Exception as e: